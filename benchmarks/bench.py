@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+#
+# The MIT License (MIT)
+#
+# Copyright (C) 2015 - Julien Desfossez <jdesfosez@efficios.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import argparse
+import os
+import resource
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path += [os.path.join(ROOT, d) for d in
+             ['linuxautomaton', 'lttnganalyses', 'lttnganalysescli']]
+
+import linuxautomaton.automaton
+from linuxautomaton import profiler
+from eventgen import EventGenerator, DEFAULT_MIX
+
+
+def parse_mix(arg):
+    mix = dict.fromkeys(DEFAULT_MIX, 0)
+    for item in arg.split(','):
+        kind, _, weight = item.partition('=')
+        if kind not in mix:
+            raise argparse.ArgumentTypeError(
+                'unknown event kind %s (choose from %s)' %
+                (kind, ', '.join(DEFAULT_MIX)))
+        try:
+            mix[kind] = float(weight)
+        except ValueError:
+            raise argparse.ArgumentTypeError('invalid weight for %s' % kind)
+    if not any(mix.values()):
+        raise argparse.ArgumentTypeError('all the weights are 0')
+    return mix
+
+
+def feed(events, providers=None):
+    automaton = linuxautomaton.automaton.Automaton(providers=providers)
+    start = time.perf_counter()
+    for ev in events:
+        automaton.process_event(ev)
+    return time.perf_counter() - start
+
+
+def feed_per_provider(events, providers=None):
+    """Feed the events with a profiler around every provider callback,
+    returns the per-provider totals"""
+    automaton = linuxautomaton.automaton.Automaton(providers=providers)
+    prof = profiler.Profiler()
+    automaton.set_profiler(prof)
+    for ev in events:
+        automaton.process_event(ev)
+    return prof.owner_totals()
+
+
+def peak_memory(events, providers=None):
+    """Peak of the memory allocated while feeding the events"""
+    tracemalloc.start()
+    feed(events, providers)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def main():
+    ap = argparse.ArgumentParser(
+        description='Measure the throughput of the automaton on a '
+                    'synthetic kernel trace')
+    ap.add_argument('-n', '--events', type=int, default=200000,
+                    help='Number of events (default 200000)')
+    ap.add_argument('--threads', type=int, default=200,
+                    help='Number of threads (default 200)')
+    ap.add_argument('--cpus', type=int, default=8,
+                    help='Number of CPUs (default 8)')
+    ap.add_argument('--duration', type=float, default=10,
+                    help='Duration of the trace in seconds (default 10)')
+    ap.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX,
+                    help='Relative weight of each kind of event, e.g. '
+                         'sched=20,syscall=40 (kinds: %s)' %
+                         ', '.join(DEFAULT_MIX))
+    ap.add_argument('--no-context', action='store_true',
+                    help='Don\'t add the pid/tid/procname contexts')
+    ap.add_argument('--providers', type=str,
+                    help='Comma-separated list of the state providers to '
+                         'run (and their dependencies), among: %s '
+                         '(default all)' %
+                         ', '.join(linuxautomaton.automaton.PROVIDERS))
+    ap.add_argument('--seed', type=int, default=0,
+                    help='Random seed (default 0)')
+    ap.add_argument('--repeat', type=int, default=3,
+                    help='Keep the best of N end-to-end runs (default 3)')
+    ap.add_argument('--no-providers', action='store_true',
+                    help='Skip the per-provider measurement')
+    ap.add_argument('--no-memory', action='store_true',
+                    help='Skip the memory measurement')
+    args = ap.parse_args()
+    providers = None
+    if args.providers:
+        providers = args.providers.split(',')
+        try:
+            linuxautomaton.automaton.resolve_providers(providers)
+        except ValueError as e:
+            ap.error(str(e))
+
+    start = time.perf_counter()
+    gen = EventGenerator(nr_threads=args.threads, nr_cpus=args.cpus,
+                         duration=args.duration, mix=args.mix,
+                         context=not args.no_context, seed=args.seed)
+    events = gen.events(args.events)
+    print('%d events, %d CPUs, %d threads, %.1f s of trace '
+          '(generated in %.2f s)' % (len(events), args.cpus, args.threads,
+                                     args.duration,
+                                     time.perf_counter() - start))
+
+    best = min(feed(events, providers) for i in range(max(args.repeat, 1)))
+    print('End-to-end: %.0f events/s (%.3f s)' % (len(events) / best, best))
+
+    if not args.no_providers:
+        totals = feed_per_provider(events, providers)
+        total = sum(t['time'] for t in totals) or 1
+        print('\nPer provider (profiled callbacks):')
+        print('%-24s %10s %10s %14s %10s %6s' % (
+            'Provider', 'Calls', 'Time (s)', 'Calls/s', 'Blocks', 'Share'))
+        for t in totals:
+            rate = '%.0f' % (t['calls'] / t['time']) if t['time'] else '-'
+            print('%-24s %10d %10.3f %14s %10d %5.1f%%' % (
+                t['owner'], t['calls'], t['time'], rate, t['blocks'],
+                t['time'] * 100 / total))
+
+    if not args.no_memory:
+        print('\nPeak memory while feeding: %.1f MB' %
+              (peak_memory(events, providers) / 1024 / 1024))
+    # kB on Linux
+    print('Peak RSS: %.1f MB' %
+          (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024))
+
+
+if __name__ == '__main__':
+    main()
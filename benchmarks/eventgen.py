@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+#
+# The MIT License (MIT)
+#
+# Copyright (C) 2015 - Julien Desfossez <jdesfosez@efficios.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import random
+from babeltrace import CTFScope
+
+# relative weight of each kind of activity
+DEFAULT_MIX = {
+    'sched': 20,
+    'syscall': 40,
+    'block': 8,
+    'irq': 12,
+    'mm': 12,
+    'net': 8,
+}
+
+BASE_TS = 1420070400 * 10 ** 9
+DISK_DEV = 8388609
+PART_DEV = 8388610
+IFACES = ['eth0', 'lo']
+# hard IRQ number -> name
+IRQS = {19: 'eth0', 44: 'ahci', 0: 'timer'}
+SOFTIRQ_VECS = [1, 2, 3, 4, 7, 9]
+RW_SYSCALLS = ['read', 'write', 'readv', 'writev', 'pread64', 'pwrite64']
+SYNC_SYSCALLS = ['fsync', 'fdatasync', 'sync']
+OTHER_SYSCALLS = ['getpid', 'futex', 'poll', 'nanosleep', 'mmap']
+
+
+class Handle():
+    __slots__ = ['id']
+
+    def __init__(self, id):
+        self.id = id
+
+
+class SyntheticEvent():
+    """Event with the subset of the babeltrace Event interface used by
+    the providers: the packet header holds stream_id, the packet
+    context cpu_id, the stream event context pid, tid and procname
+    when enabled"""
+    __slots__ = ['name', 'timestamp', 'handle', '_payload', '_context',
+                 '_fields']
+
+    def __init__(self, name, timestamp, handle, cpu_id, payload, context):
+        self.name = name
+        self.timestamp = timestamp
+        self.handle = handle
+        self._payload = payload
+        self._context = context
+        # event[key] looks in the payload first, then in the contexts
+        fields = {'cpu_id': cpu_id}
+        fields.update(context)
+        fields.update(payload)
+        self._fields = fields
+
+    def __getitem__(self, key):
+        return self._fields[key]
+
+    def keys(self):
+        return list(self._fields.keys())
+
+    def field_list_with_scope(self, scope):
+        if scope == CTFScope.EVENT_FIELDS:
+            return list(self._payload)
+        if scope == CTFScope.STREAM_EVENT_CONTEXT:
+            return list(self._context)
+        if scope == CTFScope.STREAM_PACKET_CONTEXT:
+            return ['cpu_id']
+        return []
+
+    def field_with_scope(self, field_name, scope):
+        if scope == CTFScope.TRACE_PACKET_HEADER and field_name == 'stream_id':
+            return 0
+        if scope == CTFScope.STREAM_PACKET_CONTEXT and field_name == 'cpu_id':
+            return self._fields['cpu_id']
+        if scope == CTFScope.STREAM_EVENT_CONTEXT and \
+                field_name in self._context:
+            return self._context[field_name]
+        if scope == CTFScope.EVENT_FIELDS and field_name in self._payload:
+            return self._payload[field_name]
+        return None
+
+
+class _Thread():
+    __slots__ = ['tid', 'pid', 'comm', 'fds', 'next_fd', 'syscall']
+
+    def __init__(self, tid, pid, comm):
+        self.tid = tid
+        self.pid = pid
+        self.comm = comm
+        # fd -> filename, shared by the threads of a process
+        self.fds = None
+        # next FD number, only used on the thread group leader
+        self.next_fd = 3
+        # name of the syscall in progress
+        self.syscall = None
+
+
+class EventGenerator():
+    """Synthesizes a kernel trace: a statedump, then scheduling,
+    syscalls with FDs, block requests with remaps, IRQs and softirqs,
+    page allocations and network packets, consistent with each other
+    (tasks run before they do syscalls, requests complete after they
+    are issued, ...)"""
+    def __init__(self, nr_threads=200, nr_cpus=8, duration=10,
+                 mix=None, context=True, seed=0):
+        self.nr_threads = nr_threads
+        self.nr_cpus = nr_cpus
+        self.duration_ns = int(duration * 10 ** 9)
+        self.mix = mix or DEFAULT_MIX
+        self.context = context
+        self._rand = random.Random(seed)
+        # one stream declaration per context set, like an LTTng channel
+        self._handle = Handle(0)
+
+    def events(self, count):
+        """Returns a list of about `count` events, spread over the
+        duration"""
+        r = self._rand
+        self._events = []
+        self._ts = BASE_TS
+        self._step = max(self.duration_ns // max(count, 1), 1)
+        self._threads = {}
+        for tid in range(1000, 1000 + self.nr_threads):
+            pid = tid - tid % 4
+            t = _Thread(tid, pid, 'proc%d' % pid)
+            if pid in self._threads:
+                t.fds = self._threads[pid].fds
+            else:
+                t.fds = {}
+            self._threads[tid] = t
+        self._current = {cpu: None for cpu in range(self.nr_cpus)}
+        self._pending_block = []
+        self._statedump()
+        kinds = list(self.mix)
+        weights = [self.mix[k] for k in kinds]
+        generators = {
+            'sched': self._sched,
+            'syscall': self._syscall,
+            'block': self._block,
+            'irq': self._irq,
+            'mm': self._mm,
+            'net': self._net,
+        }
+        while len(self._events) < count:
+            cpu = r.randrange(self.nr_cpus)
+            kind = r.choices(kinds, weights)[0]
+            if self._current[cpu] is None:
+                kind = 'sched'
+            generators[kind](cpu)
+        return self._events
+
+    def _add(self, name, cpu, payload, thread=None):
+        self._ts += self._rand.randint(1, 2 * self._step)
+        context = {}
+        if self.context:
+            if thread is None:
+                thread = self._current[cpu]
+            if thread is None:
+                context = {'pid': 0, 'tid': 0, 'procname': 'swapper'}
+            else:
+                context = {'pid': thread.pid, 'tid': thread.tid,
+                           'procname': thread.comm}
+        self._events.append(SyntheticEvent(name, self._ts, self._handle,
+                                           cpu, payload, context))
+
+    def _statedump(self):
+        for t in self._threads.values():
+            self._add('lttng_statedump_process_state', 0,
+                      {'tid': t.tid, 'pid': t.pid, 'name': t.comm,
+                       'ppid': 1, 'type': 0, 'mode': 0, 'submode': 0,
+                       'status': 5, 'vtid': t.tid, 'vpid': t.pid})
+        for t in self._threads.values():
+            if t.tid != t.pid:
+                continue
+            for fd in range(3, 6):
+                filename = '/var/lib/proc%d/file%d' % (t.pid, fd)
+                t.fds[fd] = filename
+                self._add('lttng_statedump_file_descriptor', 0,
+                          {'pid': t.pid, 'fd': fd, 'filename': filename,
+                           'flags': 0, 'fmode': 0})
+            t.next_fd = 6
+        self._add('lttng_statedump_block_device', 0,
+                  {'dev': DISK_DEV, 'diskname': 'sda'})
+        self._add('lttng_statedump_block_device', 0,
+                  {'dev': PART_DEV, 'diskname': 'sda1'})
+
+    def _sched(self, cpu):
+        r = self._rand
+        prev = self._current[cpu]
+        running = set(t.tid for t in self._current.values() if t)
+        idle = [tid for tid in self._threads if tid not in running]
+        nxt = self._threads[r.choice(idle)] if idle else None
+        if nxt is not None and r.random() < 0.8:
+            self._add('sched_wakeup', cpu,
+                      {'comm': nxt.comm, 'tid': nxt.tid, 'prio': 120,
+                       'success': 1, 'target_cpu': cpu})
+        if r.random() < 0.05 and nxt is not None:
+            self._add('sched_migrate_task', cpu,
+                      {'comm': nxt.comm, 'tid': nxt.tid, 'prio': 120,
+                       'orig_cpu': r.randrange(self.nr_cpus),
+                       'dest_cpu': cpu})
+        self._add('sched_switch', cpu,
+                  {'prev_comm': prev.comm if prev else 'swapper',
+                   'prev_tid': prev.tid if prev else 0, 'prev_prio': 120,
+                   'prev_state': 1,
+                   'next_comm': nxt.comm if nxt else 'swapper',
+                   'next_tid': nxt.tid if nxt else 0, 'next_prio': 120})
+        self._current[cpu] = nxt
+
+    def _syscall(self, cpu):
+        r = self._rand
+        t = self._current[cpu]
+        if t.syscall is not None:
+            self._syscall_exit(cpu, t)
+            return
+        x = r.random()
+        if x < 0.1 or not t.fds:
+            name = 'openat'
+            payload = {'dfd': -100, 'filename': '/data/file%d' %
+                       r.randrange(100), 'flags': 0, 'mode': 0}
+        elif x < 0.18:
+            name = 'close'
+            payload = {'fd': r.choice(list(t.fds))}
+        elif x < 0.75:
+            name = r.choice(RW_SYSCALLS)
+            payload = {'fd': r.choice(list(t.fds))}
+            if name.endswith('v'):
+                payload['vlen'] = r.randint(1, 4)
+            else:
+                payload['count'] = r.choice([512, 4096, 65536])
+        elif x < 0.8:
+            name = r.choice(SYNC_SYSCALLS)
+            payload = {} if name == 'sync' else {'fd': r.choice(list(t.fds))}
+        elif x < 0.85:
+            name = 'socket'
+            payload = {'family': 2, 'type': 1, 'protocol': 0}
+        elif x < 0.9:
+            name = 'sendto'
+            payload = {'fd': r.choice(list(t.fds)), 'len': 1400,
+                       'flags': 0}
+        else:
+            name = r.choice(OTHER_SYSCALLS)
+            payload = {}
+        t.syscall = (name, payload)
+        self._add('syscall_entry_' + name, cpu, payload)
+
+    def _syscall_exit(self, cpu, t):
+        r = self._rand
+        name, payload = t.syscall
+        t.syscall = None
+        ret = 0
+        if name in ('openat', 'socket'):
+            if r.random() < 0.1:
+                ret = -2
+            else:
+                leader = self._threads[t.pid]
+                ret = leader.next_fd
+                leader.next_fd += 1
+                t.fds[ret] = payload.get('filename', 'socket')
+        elif name == 'close':
+            t.fds.pop(payload['fd'], None)
+        elif 'count' in payload:
+            ret = r.randint(0, payload['count'])
+        elif name in ('readv', 'writev', 'sendto'):
+            ret = r.randint(0, 8192)
+        self._add('syscall_exit_' + name, cpu, {'ret': ret})
+
+    def _block(self, cpu):
+        r = self._rand
+        if self._pending_block and r.random() < 0.5:
+            i = r.randrange(len(self._pending_block))
+            sector, nr_sector = self._pending_block.pop(i)
+            self._add('block_rq_complete', cpu,
+                      {'dev': DISK_DEV, 'sector': sector,
+                       'nr_sector': nr_sector, 'errors': 0, 'rwbs': 0})
+            return
+        sector = r.randrange(1 << 20) * 8
+        nr_sector = r.choice([8, 16, 256])
+        # requests on the partition are remapped to the disk
+        if r.random() < 0.5:
+            self._add('block_bio_remap', cpu,
+                      {'dev': DISK_DEV, 'sector': sector + 2048,
+                       'nr_sector': nr_sector, 'rwbs': 0,
+                       'old_dev': PART_DEV, 'old_sector': sector})
+            sector += 2048
+        self._add('block_rq_issue', cpu,
+                  {'dev': DISK_DEV, 'sector': sector,
+                   'nr_sector': nr_sector, 'bytes': nr_sector * 512,
+                   'rwbs': r.randrange(4),
+                   'tid': self._current[cpu].tid,
+                   'comm': self._current[cpu].comm})
+        self._pending_block.append((sector, nr_sector))
+
+    def _irq(self, cpu):
+        r = self._rand
+        if r.random() < 0.5:
+            irq = r.choice(list(IRQS))
+            self._add('irq_handler_entry', cpu,
+                      {'irq': irq, 'name': IRQS[irq]})
+            self._add('irq_handler_exit', cpu, {'irq': irq, 'ret': 1})
+        else:
+            vec = r.choice(SOFTIRQ_VECS)
+            self._add('softirq_raise', cpu, {'vec': vec})
+            self._add('softirq_entry', cpu, {'vec': vec})
+            self._add('softirq_exit', cpu, {'vec': vec})
+
+    def _mm(self, cpu):
+        r = self._rand
+        x = r.random()
+        if x < 0.45:
+            self._add('mm_page_alloc', cpu,
+                      {'page': r.getrandbits(40), 'order': 0,
+                       'gfp_flags': 0, 'migratetype': 0})
+        elif x < 0.9:
+            self._add('mm_page_free', cpu,
+                      {'page': r.getrandbits(40), 'order': 0})
+        elif x < 0.97:
+            self._add('block_dirty_buffer', cpu,
+                      {'dev': PART_DEV, 'sector': r.randrange(1 << 20),
+                       'size': 4096})
+        else:
+            self._add('writeback_pages_written', cpu,
+                      {'pages': r.randint(1, 64)})
+
+    def _net(self, cpu):
+        r = self._rand
+        name = r.choice(['net_dev_xmit', 'netif_receive_skb'])
+        payload = {'skbaddr': r.getrandbits(40), 'len': r.randint(60, 1514),
+                   'name': r.choice(IFACES)}
+        if name == 'net_dev_xmit':
+            payload['rc'] = 0
+        self._add(name, cpu, payload)
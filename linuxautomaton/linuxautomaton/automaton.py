@@ -29,6 +29,40 @@ from .syscalls import SyscallsStateProvider
 from .statedump import StatedumpStateProvider
 from .block import BlockStateProvider
 from .net import NetStateProvider
+from linuxautomaton import sp, sv, common
+from array import array
+from collections import OrderedDict
+
+# provider name -> (class, names of the providers whose state it reads),
+# in the order they get the events. sched also fixes the pid of the
+# tasks from the context of the syscall entries, for all the others
+PROVIDERS = OrderedDict([
+    ('sched', (SchedStateProvider, [])),
+    # the current task of the CPUs comes from sched
+    ('mem', (MemStateProvider, ['sched'])),
+    ('irq', (IrqStateProvider, [])),
+    ('syscalls', (SyscallsStateProvider, ['sched'])),
+    ('statedump', (StatedumpStateProvider, [])),
+    ('block', (BlockStateProvider, [])),
+    ('net', (NetStateProvider, ['sched'])),
+])
+
+
+def resolve_providers(names=None):
+    """Names of the providers needed for names (all of them if None)
+    and their dependencies, in dispatch order"""
+    if names is None:
+        return tuple(PROVIDERS)
+    needed = set()
+    todo = list(names)
+    while todo:
+        name = todo.pop()
+        if name not in PROVIDERS:
+            raise ValueError('unknown state provider: %s' % name)
+        if name not in needed:
+            needed.add(name)
+            todo += PROVIDERS[name][1]
+    return tuple(name for name in PROVIDERS if name in needed)
 
 
 class State:
@@ -42,24 +76,180 @@ class State:
         self.dirty_pages = {}
         self.interrupts = {}
         self.pending_syscalls = []
+        # target CPU of the pending wakeups, by tid
+        self.pending_wakeups = {}
+        # block remap requests, keyed by (dev, sector)
+        self.remap_requests = OrderedDict()
+        # completed I/O requests, referenced by row number
+        self.iorequests = sv.IORequestStore()
+        # keep the log of the completed interrupts (irq-list), only
+        # needed to output it
+        self.keep_irq_list = True
+
+    def merge(self, other):
+        """Merge the state built by an automaton fed with another subset
+        of the streams (CPUs) of the same trace into this one"""
+        offset = self.iorequests.extend(other.iorequests)
+        if offset:
+            other._shift_iorequests(offset)
+        _merge_objects(self.cpus, other.cpus)
+        _merge_objects(self.tids, other.tids)
+        _merge_objects(self.ifaces, other.ifaces)
+        for dev, disk in other.disks.items():
+            if dev not in self.disks:
+                self.disks[dev] = disk
+                continue
+            # keep the name from the statedump if one side had it
+            if self.disks[dev].prettyname == common.kdev_major_minor(dev):
+                self.disks[dev].prettyname = disk.prettyname
+            self.disks[dev].merge(disk)
+            # completion order
+            self.disks[dev].rq_list = array('I', sorted(
+                self.disks[dev].rq_list,
+                key=self.iorequests.end.__getitem__))
+        for name, syscall in other.syscalls.items():
+            if name not in self.syscalls:
+                self.syscalls[name] = syscall
+            elif name == "total":
+                self.syscalls[name] += syscall
+            else:
+                self.syscalls[name].merge(syscall)
+        for key, value in other.mm.items():
+            self.mm[key] = self.mm.get(key, 0) + value
+        if "pages" in other.dirty_pages:
+            self.dirty_pages.setdefault("pages", sv.DirtyPageQueue())
+            self.dirty_pages["pages"].extend(other.dirty_pages["pages"])
+            for key in ["global_nr_dirty", "base_nr_dirty"]:
+                if self.dirty_pages.get(key, -1) == -1:
+                    self.dirty_pages[key] = other.dirty_pages[key]
+        self._merge_interrupts(other.interrupts)
+        self.pending_syscalls += other.pending_syscalls
+        for tid, cpu_id in other.pending_wakeups.items():
+            self.pending_wakeups.setdefault(tid, cpu_id)
+        self.remap_requests.update(other.remap_requests)
+
+    def _shift_iorequests(self, offset):
+        """Renumber the IORequest rows after moving them to another
+        store"""
+        seen = set()
+        rows = []
+        for proc in self.tids.values():
+            rows.append(proc.iorequests)
+            for fd in list(proc.fds.values()) + \
+                    list(proc.closed_fds.values()):
+                # FDs can be shared between processes
+                if id(fd) not in seen:
+                    seen.add(id(fd))
+                    rows.append(fd.iorequests)
+        for disk in self.disks.values():
+            rows.append(disk.rq_list)
+        for r in rows:
+            for i in range(len(r)):
+                r[i] += offset
+
+    def _merge_interrupts(self, other):
+        irq = self.interrupts
+        if not irq:
+            irq.update(other)
+            return
+        if not other:
+            return
+        irq["hard_count"] += other["hard_count"]
+        irq["soft_count"] += other["soft_count"]
+        for key in ["hard-per-cpu", "soft-per-cpu", "raise-per-cpu",
+                    "names", "raise-latency"]:
+            irq[key].update(other[key])
+        for key in ["hard-irqs", "soft-irqs"]:
+            for nr, instance in other[key].items():
+                if nr not in irq[key]:
+                    irq[key][nr] = instance
+                else:
+                    sv.IRQ.merge_irq_instance(irq[key][nr], instance)
+        # the log is in the order the handlers completed
+        irq["irq-list"] += other["irq-list"]
+        irq["irq-list"].sort(key=lambda i: i.stop_ts)
+
+
+def _merge_objects(mine, other):
+    for key, value in other.items():
+        if key in mine:
+            mine[key].merge(value)
+        else:
+            mine[key] = value
 
 
 class Automaton:
-    def __init__(self):
-        self._state = State()
-        self._state_providers = [
-            SchedStateProvider(self._state),
-            MemStateProvider(self._state),
-            IrqStateProvider(self._state),
-            SyscallsStateProvider(self._state),
-            StatedumpStateProvider(self._state),
-            BlockStateProvider(self._state),
-            NetStateProvider(self._state),
-        ]
+    def __init__(self, state=None, providers=None):
+        # start from a restored state (see snapshot) or from scratch
+        if state is None:
+            state = State()
+        self._state = state
+        # only the providers of the state the analyses read, the events
+        # no one handles are skipped
+        self.providers = resolve_providers(providers)
+        self._state_providers = [PROVIDERS[name][0](self._state)
+                                 for name in self.providers]
+        # shared by the providers, see clear_field_plans()
+        self._field_plans = sp.FieldPlans()
+        for provider in self._state_providers:
+            provider._set_field_plans(self._field_plans)
 
-    def process_event(self, ev):
+        self._analyses = []
+        # event name -> list of the callbacks interested in it
+        self._cbs_table = {}
+        # wraps the callbacks of the table when set (see profiler)
+        self._profiler = None
+
+    def add_analysis(self, analysis):
+        """Registers an analysis object so it gets its events through
+        the same dispatch table as the state providers, before them"""
+        self._analyses.append(analysis)
+        self._cbs_table = {}
+
+    def set_profiler(self, profiler):
+        """Record the calls of all the callbacks with profiler, None to
+        stop. Nothing is added to the dispatch when there is none"""
+        self._profiler = profiler
+        self._cbs_table = {}
+
+    def _build_event_cbs(self, name):
+        cbs = []
+        for owner in self._analyses + self._state_providers:
+            owner_cbs = owner.get_event_cbs(name)
+            if self._profiler is not None:
+                owner_cbs = [self._profiler.wrap(type(owner).__name__,
+                                                 name, cb)
+                             for cb in owner_cbs]
+            cbs += owner_cbs
+        cbs = tuple(cbs)
+        self._cbs_table[name] = cbs
+        return cbs
+
+    def get_event_cbs(self, name):
+        cbs = self._cbs_table.get(name)
+        if cbs is None:
+            cbs = self._build_event_cbs(name)
+        return cbs
+
+    def clear_field_plans(self):
+        """Forget the fields of the event declarations, called when
+        the trace is (re)opened"""
+        self._field_plans.clear()
+
+    def evict_history(self):
+        """Drop what the state providers keep about the events of the
+        past refresh windows, called at each boundary"""
         for sp in self._state_providers:
-            sp.process_event(ev)
+            sp.evict_history()
+        # nothing references the stored requests anymore
+        self._state.iorequests.clear()
+
+    def process_event(self, ev):
+        cbs = self._cbs_table.get(ev.name)
+        if cbs is None:
+            cbs = self._build_event_cbs(ev.name)
+        for cb in cbs:
+            cb(ev)
 
     @property
     def state(self):
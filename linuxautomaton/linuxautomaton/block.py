@@ -23,15 +23,20 @@
 # SOFTWARE.
 
 from linuxautomaton import sp, sv, common
+from array import array
 
 
 class BlockStateProvider(sp.StateProvider):
+    # remaps not completed after that long are considered lost
+    REMAP_TIMEOUT = 10 * common.NSEC_PER_SEC
+
     def __init__(self, state):
         self.state = state
         self.cpus = state.cpus
         self.disks = state.disks
         self.tids = state.tids
-        self.remap_requests = []
+        self.remap_requests = state.remap_requests
+        self.iorequests = state.iorequests
         cbs = {
             'block_rq_complete': self._process_block_rq_complete,
             'block_rq_issue': self._process_block_rq_issue,
@@ -40,6 +45,10 @@ class BlockStateProvider(sp.StateProvider):
         }
         self._register_cbs(cbs)
 
+    def evict_history(self):
+        for disk in self.disks.values():
+            disk.rq_list = array('I')
+
     def process_event(self, ev):
         self._process_event_cb(ev)
 
@@ -49,17 +58,25 @@ class BlockStateProvider(sp.StateProvider):
         old_dev = event["old_dev"]
         old_sector = event["old_sector"]
 
-        for req in self.remap_requests:
-            if req["dev"] == old_dev and req["sector"] == old_sector:
-                req["dev"] = dev
-                req["sector"] = sector
-                return
-
-        req = {}
-        req["orig_dev"] = old_dev
+        # the remap requests are keyed by their current (dev, sector)
+        req = self.remap_requests.pop((old_dev, old_sector), None)
+        if req is None:
+            req = {}
+            req["orig_dev"] = old_dev
         req["dev"] = dev
         req["sector"] = sector
-        self.remap_requests.append(req)
+        req["ts"] = event.timestamp
+        self.remap_requests.pop((dev, sector), None)
+        self.remap_requests[(dev, sector)] = req
+        self._expire_remap_requests(event.timestamp)
+
+    def _expire_remap_requests(self, ts):
+        # oldest first
+        while self.remap_requests:
+            req = next(iter(self.remap_requests.values()))
+            if ts - req["ts"] < self.REMAP_TIMEOUT:
+                break
+            self.remap_requests.popitem(last=False)
 
     # For backmerge requests, just remove the request from the
     # remap_requests queue, because we rely later on the nr_sector
@@ -67,9 +84,7 @@ class BlockStateProvider(sp.StateProvider):
     def _process_block_bio_backmerge(self, event):
         dev = event["dev"]
         sector = event["sector"]
-        for req in self.remap_requests:
-            if req["dev"] == dev and req["sector"] == sector:
-                self.remap_requests.remove(req)
+        self.remap_requests.pop((dev, sector), None)
 
     def _process_block_rq_issue(self, event):
         dev = event["dev"]
@@ -89,9 +104,9 @@ class BlockStateProvider(sp.StateProvider):
         rq["iorequest"].size = nr_sector * block_size
 
         d = None
-        for req in self.remap_requests:
-            if req["dev"] == dev and req["sector"] == sector:
-                d = common.get_disk(req["orig_dev"], self.disks)
+        req = self.remap_requests.get((dev, sector))
+        if req is not None:
+            d = common.get_disk(req["orig_dev"], self.disks)
         if not d:
             d = common.get_disk(dev, self.disks)
 
@@ -99,7 +114,7 @@ class BlockStateProvider(sp.StateProvider):
         d.nr_sector += nr_sector
         d.pending_requests[sector] = rq
 
-        if "tid" in event.keys():
+        if self.get_field_plan(event).tid:
             tid = event["tid"]
             if tid not in self.tids:
                 p = sv.Process()
@@ -126,10 +141,9 @@ class BlockStateProvider(sp.StateProvider):
             return
 
         d = None
-        for req in self.remap_requests:
-            if req["dev"] == dev and req["sector"] == sector:
-                d = common.get_disk(req["orig_dev"], self.disks)
-                self.remap_requests.remove(req)
+        req = self.remap_requests.pop((dev, sector), None)
+        if req is not None:
+            d = common.get_disk(req["orig_dev"], self.disks)
 
         if not d:
             d = common.get_disk(dev, self.disks)
@@ -147,14 +161,16 @@ class BlockStateProvider(sp.StateProvider):
             print("Weird request TS", event.timestamp)
         time_per_sector = (event.timestamp - rq["rq_time"]) / rq["nr_sector"]
         d.request_time += time_per_sector
+        d.latency.add(time_per_sector)
         rq["iorequest"].duration = time_per_sector
         rq["iorequest"].end = event.timestamp
-        d.rq_list.append(rq["iorequest"])
+        row = self.iorequests.append(rq["iorequest"])
+        d.rq_list.append(row)
         if "pid" in rq.keys():
-            rq["pid"].iorequests.append(rq["iorequest"])
+            rq["pid"].iorequests.append(row)
         del d.pending_requests[sector]
 
     def dump_orphan_requests(self):
-        for req in self.remap_requests:
+        for req in self.remap_requests.values():
             print("Orphan : %d : %d %d" % (req["orig_dev"], req["dev"],
                                            req["sector"]))
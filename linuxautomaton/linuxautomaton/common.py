@@ -230,19 +230,73 @@ def ns_to_hour(ns):
     return "%02d:%02d:%02d" % (d.tm_hour, d.tm_min, d.tm_sec)
 
 
+def hour_nsec_formatter(multi_day=False, gmt=False):
+    """Returns a function formatting a timestamp like ns_to_hour_nsec,
+    the date and time of the seconds already seen are cached so only the
+    nanoseconds get formatted for each call"""
+    to_tm = time.gmtime if gmt else time.localtime
+    cache = {}
+
+    def fmt(ns):
+        sec, nsec = divmod(ns, NSEC_PER_SEC)
+        prefix = cache.get(sec)
+        if prefix is None:
+            if len(cache) >= _HOUR_CACHE_SIZE:
+                cache.clear()
+            d = to_tm(sec)
+            if multi_day:
+                prefix = "%04d-%02d-%02d %02d:%02d:%02d" % (
+                    d.tm_year, d.tm_mon, d.tm_mday, d.tm_hour, d.tm_min,
+                    d.tm_sec)
+            else:
+                prefix = "%02d:%02d:%02d" % (d.tm_hour, d.tm_min, d.tm_sec)
+            cache[sec] = prefix
+        return "%s.%09d" % (prefix, nsec)
+    return fmt
+
+
+# seconds kept by each formatter
+_HOUR_CACHE_SIZE = 4096
+# (multi_day, gmt) -> formatter
+_hour_nsec_formatters = {}
+
+
 def ns_to_hour_nsec(ns, multi_day=False, gmt=False):
-    if gmt:
-        d = time.gmtime(ns/NSEC_PER_SEC)
-    else:
-        d = time.localtime(ns/NSEC_PER_SEC)
-    if multi_day:
-        return "%04d-%02d-%02d %02d:%02d:%02d.%09d" % (d.tm_year, d.tm_mon,
-                                                       d.tm_mday, d.tm_hour,
-                                                       d.tm_min, d.tm_sec,
-                                                       ns % NSEC_PER_SEC)
-    else:
-        return "%02d:%02d:%02d.%09d" % (d.tm_hour, d.tm_min, d.tm_sec,
-                                        ns % NSEC_PER_SEC)
+    key = (bool(multi_day), bool(gmt))
+    fmt = _hour_nsec_formatters.get(key)
+    if fmt is None:
+        fmt = hour_nsec_formatter(*key)
+        _hour_nsec_formatters[key] = fmt
+    return fmt(ns)
+
+
+class LineWriter:
+    """Writes lines to out (sys.stdout by default) in large chunks
+    instead of one write per line, flushed when used as a context
+    manager"""
+    # lines per write
+    BUFFER_LINES = 4096
+
+    def __init__(self, out=None):
+        self._out = out if out is not None else sys.stdout
+        self._lines = []
+
+    def write_line(self, line):
+        self._lines.append(line)
+        if len(self._lines) >= self.BUFFER_LINES:
+            self.flush()
+
+    def flush(self):
+        if self._lines:
+            self._lines.append("")
+            self._out.write("\n".join(self._lines))
+            self._lines = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
 
 
 def ns_to_sec(ns):
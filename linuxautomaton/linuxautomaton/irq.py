@@ -31,16 +31,17 @@ class IrqStateProvider(sp.StateProvider):
         self.irq = state.interrupts
         self.cpus = state.cpus
         self.tids = state.tids
-        self.irq["hard_count"] = 0
-        self.irq["soft_count"] = 0
-        self.irq["hard-per-cpu"] = {}
-        self.irq["soft-per-cpu"] = {}
-        self.irq["raise-per-cpu"] = {}
-        self.irq["names"] = {}
-        self.irq["hard-irqs"] = {}
-        self.irq["soft-irqs"] = {}
-        self.irq["raise-latency"] = {}
-        self.irq["irq-list"] = []
+        # keep what a restored state already has
+        self.irq.setdefault("hard_count", 0)
+        self.irq.setdefault("soft_count", 0)
+        self.irq.setdefault("hard-per-cpu", {})
+        self.irq.setdefault("soft-per-cpu", {})
+        self.irq.setdefault("raise-per-cpu", {})
+        self.irq.setdefault("names", {})
+        self.irq.setdefault("hard-irqs", {})
+        self.irq.setdefault("soft-irqs", {})
+        self.irq.setdefault("raise-latency", {})
+        self.irq.setdefault("irq-list", [])
         cbs = {
             'irq_handler_entry': self._process_irq_handler_entry,
             'irq_handler_exit': self._process_irq_handler_exit,
@@ -50,6 +51,9 @@ class IrqStateProvider(sp.StateProvider):
         }
         self._register_cbs(cbs)
 
+    def evict_history(self):
+        self.irq["irq-list"] = []
+
     def process_event(self, ev):
         self._process_event_cb(ev)
 
@@ -88,6 +92,7 @@ class IrqStateProvider(sp.StateProvider):
             irq_entry["min"] = duration
         irq_entry["count"] += 1
         irq_entry["total"] += duration
+        irq_entry["duration"].add(duration)
         # compute raise latency if applicable
         if i.raise_ts == -1:
             return True
@@ -98,6 +103,7 @@ class IrqStateProvider(sp.StateProvider):
             irq_entry["raise_min"] = latency
         irq_entry["raise_count"] += 1
         irq_entry["raise_total"] += latency
+        irq_entry["raise"].add(latency)
         return True
 
     def exit(self, event, idfield, per_cpu_key, irq_type):
@@ -121,9 +127,9 @@ class IrqStateProvider(sp.StateProvider):
         if hasattr(self.state, "min") and self.state.min is not None and \
                 duration < self.state.min * 1000:
             return False
-        self.irq[irq_type][i.nr]["list"].append(i)
         self.compute_stats(self.irq[irq_type][i.nr], i)
-        self.irq["irq-list"].append(i)
+        if self.state.keep_irq_list:
+            self.irq["irq-list"].append(i)
         return i
 
     def _process_irq_handler_exit(self, event):
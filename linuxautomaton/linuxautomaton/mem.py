@@ -22,7 +22,7 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-from linuxautomaton import sp
+from linuxautomaton import sp, sv
 
 
 class MemStateProvider(sp.StateProvider):
@@ -32,13 +32,16 @@ class MemStateProvider(sp.StateProvider):
         self.cpus = state.cpus
         self.tids = state.tids
         self.dirty_pages = state.dirty_pages
-        self.mm["allocated_pages"] = 0
-        self.mm["freed_pages"] = 0
-        self.mm["count"] = 0
-        self.mm["dirty"] = 0
-        self.dirty_pages["pages"] = []
-        self.dirty_pages["global_nr_dirty"] = -1
-        self.dirty_pages["base_nr_dirty"] = -1
+        # keep what a restored state already has
+        self.mm.setdefault("allocated_pages", 0)
+        self.mm.setdefault("freed_pages", 0)
+        self.mm.setdefault("count", 0)
+        self.mm.setdefault("dirty", 0)
+        # never reset, the syscalls count their allocations from it
+        self.mm.setdefault("alloc_events", 0)
+        self.dirty_pages.setdefault("pages", sv.DirtyPageQueue())
+        self.dirty_pages.setdefault("global_nr_dirty", -1)
+        self.dirty_pages.setdefault("base_nr_dirty", -1)
         cbs = {
             'mm_page_alloc': self._process_mm_page_alloc,
             'mm_page_free': self._process_mm_page_free,
@@ -63,13 +66,7 @@ class MemStateProvider(sp.StateProvider):
     def _process_mm_page_alloc(self, event):
         self.mm["count"] += 1
         self.mm["allocated_pages"] += 1
-        for p in self.tids.values():
-            if len(p.current_syscall.keys()) == 0:
-                continue
-            if "alloc" not in p.current_syscall.keys():
-                p.current_syscall["alloc"] = 1
-            else:
-                p.current_syscall["alloc"] += 1
+        self.mm["alloc_events"] += 1
         t = self._get_current_proc(event)
         if t is None:
             return
@@ -66,7 +66,7 @@ class NetStateProvider(sp.StateProvider):
         t = self.tids[c.current_tid]
         if not t.current_syscall:
             return
-        if t.current_syscall["name"] in sv.SyscallConsts.WRITE_SYSCALLS:
+        if t.current_syscall["info"].write:
             if t.current_syscall["fd"].fdtype == sv.FDType.unknown:
                 t.current_syscall["fd"].fdtype = sv.FDType.maybe_net
 
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+#
+# The MIT License (MIT)
+#
+# Copyright (C) 2015 - Julien Desfossez <jdesfosez@efficios.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import json
+import sys
+import time
+
+
+class Profiler:
+    """Call count, time and memory blocks allocated by each callback of
+    the state providers and analyses, per event name.
+
+    The blocks are the net number of memory blocks still allocated when
+    the callback returns (sys.getallocatedblocks), what it added to the
+    state more than what it allocated temporarily"""
+
+    def __init__(self):
+        # (owner, event name) -> [calls, seconds, blocks]
+        self._stats = {}
+
+    def wrap(self, owner, name, cb):
+        """Returns a callback recording the calls of cb under owner
+        (class name of the provider or analysis) and name"""
+        stats = self._stats.setdefault((owner, name), [0, 0, 0])
+        clock = time.perf_counter
+        blocks = sys.getallocatedblocks
+
+        def profiled(ev):
+            nr_blocks = blocks()
+            start = clock()
+            cb(ev)
+            stats[1] += clock() - start
+            stats[2] += blocks() - nr_blocks
+            stats[0] += 1
+        return profiled
+
+    def results(self):
+        """List of the per owner and event name results, by decreasing
+        time"""
+        ret = []
+        for (owner, name), (calls, secs, blocks) in self._stats.items():
+            if calls == 0:
+                continue
+            ret.append({'owner': owner, 'event': name, 'calls': calls,
+                        'time': secs, 'blocks': blocks})
+        ret.sort(key=lambda r: r['time'], reverse=True)
+        return ret
+
+    def owner_totals(self):
+        """Same as results, summed per owner"""
+        totals = {}
+        for r in self.results():
+            t = totals.setdefault(r['owner'], {'owner': r['owner'],
+                                               'calls': 0, 'time': 0,
+                                               'blocks': 0})
+            for key in ['calls', 'time', 'blocks']:
+                t[key] += r[key]
+        return sorted(totals.values(), key=lambda t: t['time'],
+                      reverse=True)
+
+    def print_summary(self, out=sys.stderr):
+        results = self.results()
+        total = sum(r['time'] for r in results) or 1
+        fmt = '%-26s %-28s %10s %10s %12s %6s'
+        print('Provider profile', file=out)
+        print(fmt % ('Provider', 'Event', 'Calls', 'Time (s)', 'Blocks',
+                     'Share'), file=out)
+        for r in self.owner_totals():
+            print(fmt % (r['owner'], '(total)', r['calls'],
+                         '%.3f' % r['time'], r['blocks'],
+                         '%.1f%%' % (r['time'] * 100 / total)), file=out)
+        print(file=out)
+        for r in results:
+            print(fmt % (r['owner'], r['event'], r['calls'],
+                         '%.3f' % r['time'], r['blocks'],
+                         '%.1f%%' % (r['time'] * 100 / total)), file=out)
+
+    def dump_json(self, out):
+        json.dump({'owners': self.owner_totals(),
+                   'callbacks': self.results()}, out, indent=2)
@@ -22,16 +22,20 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-from linuxautomaton import sp, sv
-from babeltrace import CTFScope
+from linuxautomaton import sp, sv, common
 
 
 class SchedStateProvider(sp.StateProvider):
+    # tasks woken up and not scheduled in after that long are
+    # considered lost (exited or missing events)
+    WAKEUP_TIMEOUT = 10 * common.NSEC_PER_SEC
+
     def __init__(self, state):
         self.state = state
         self.cpus = state.cpus
         self.tids = state.tids
         self.dirty_pages = state.dirty_pages
+        self.pending_wakeups = state.pending_wakeups
         cbs = {
             'sched_switch': self._process_sched_switch,
             'sched_migrate_task': self._process_sched_migrate_task,
@@ -39,6 +43,8 @@ class SchedStateProvider(sp.StateProvider):
             'sched_wakeup_new': self._process_sched_wakeup,
             'sched_process_fork': self._process_sched_process_fork,
             'sched_process_exec': self._process_sched_process_exec,
+            # only to fix the pid of the tasks from the context
+            'syscall_entry': self._process_syscall_entry,
         }
         self._register_cbs(cbs)
 
@@ -60,9 +66,8 @@ class SchedStateProvider(sp.StateProvider):
                 c.current_tid = -1
         else:
             self.add_cpu(cpu_id, ts, next_tid)
-        for context in event.keys():
-            if context.startswith("perf_"):
-                c.perf[context] = event[context]
+        for context in self.get_field_plan(event).perf:
+            c.perf[context] = event[context]
 
     def add_cpu(self, cpu_id, ts, next_tid):
         c = sv.CPU()
@@ -87,20 +92,18 @@ class SchedStateProvider(sp.StateProvider):
             if p.last_sched is not None:
                 p.cpu_ns += (ts - p.last_sched)
             # perf PMU counters checks
-            for context in event.field_list_with_scope(
-                    CTFScope.STREAM_EVENT_CONTEXT):
-                if context.startswith("perf_"):
-                    if context not in c.perf.keys():
-                        c.perf[context] = event[context]
-                    # add the difference between the last known value
-                    # for this counter on the current sv.CPU
-                    diff = event[context] - c.perf[context]
-                    if context not in p.perf.keys():
-                        p.perf[context] = diff
-                    else:
-                        p.perf[context] += diff
-                    if diff > 0:
-                        ret[context] = diff
+            for context in self.get_field_plan(event).perf:
+                if context not in c.perf.keys():
+                    c.perf[context] = event[context]
+                # add the difference between the last known value
+                # for this counter on the current sv.CPU
+                diff = event[context] - c.perf[context]
+                if context not in p.perf.keys():
+                    p.perf[context] = diff
+                else:
+                    p.perf[context] += diff
+                if diff > 0:
+                    ret[context] = diff
 
         # exclude swapper process
         if next_tid == 0:
@@ -115,11 +118,13 @@ class SchedStateProvider(sp.StateProvider):
             p = self.tids[next_tid]
             p.comm = next_comm
         p.last_sched = ts
-        for q in c.wakeup_queue:
-            if q["task"] == p:
-                ret["sched_latency"] = ts - q["ts"]
-                ret["next_tid"] = next_tid
-                c.wakeup_queue.remove(q)
+        # the task may have been migrated since its wakeup
+        wakeup_cpu = self.pending_wakeups.pop(next_tid, None)
+        if wakeup_cpu is not None:
+            latency = ts - self.cpus[wakeup_cpu].wakeups.pop(next_tid)
+            p.sched_latency.add(latency)
+            ret["sched_latency"] = latency
+            ret["next_tid"] = next_tid
         return ret
 
     def clear_dirty_pages(self, to_clean, reason):
@@ -129,11 +134,11 @@ class SchedStateProvider(sp.StateProvider):
 #                (ns_to_hour_nsec(event.timestamp), nr, current,
 #                    self.dirty_pages["base_nr_dirty"],
 #                    to_clean, self.dirty_pages["global_nr_dirty"]))
-        if to_clean > len(self.dirty_pages["pages"]):
-            to_clean = len(self.dirty_pages["pages"])
+        pages = self.dirty_pages["pages"]
+        if to_clean > len(pages):
+            to_clean = len(pages)
         for i in range(to_clean):
-            a = self.dirty_pages["pages"].pop(0)
-            cleaned.append(a)
+            cleaned.append(pages.popleft())
 
         # don't account background kernel threads emptying the
         # page cache
@@ -150,12 +155,12 @@ class SchedStateProvider(sp.StateProvider):
     def track_dirty_pages(self, event):
         if "pages" not in self.dirty_pages.keys():
             return
-        if "nr_dirty" not in event.keys():
+        if not self.get_field_plan(event).nr_dirty:
             # if the context is not available, only keep the
             # last 1000 pages inserted (arbitrary)
-            if len(self.dirty_pages["pages"]) > 1000:
-                for i in range(len(self.dirty_pages["pages"]) - 1000):
-                    self.dirty_pages["pages"].pop(0)
+            pages = self.dirty_pages["pages"]
+            while len(pages) > 1000:
+                pages.popleft()
             return
         nr = event["nr_dirty"]
 #        current = len(self.dirty_pages["pages"])
@@ -228,9 +233,19 @@ class SchedStateProvider(sp.StateProvider):
             p = sv.Process()
             p.tid = tid
             self.tids[tid] = p
-        else:
-            p = self.tids[tid]
-        c.wakeup_queue.append({"ts": event.timestamp, "task": p})
+        # the latency is counted from the first wakeup
+        if tid not in self.pending_wakeups:
+            c.wakeups[tid] = event.timestamp
+            self.pending_wakeups[tid] = target_cpu
+        self._expire_wakeups(c, event.timestamp)
+
+    def _expire_wakeups(self, c, ts):
+        while c.wakeups:
+            tid, wakeup_ts = next(iter(c.wakeups.items()))
+            if ts - wakeup_ts < self.WAKEUP_TIMEOUT:
+                break
+            c.wakeups.popitem(last=False)
+            del self.pending_wakeups[tid]
 
     def fix_process(self, name, tid, pid):
         if tid not in self.tids:
@@ -251,6 +266,27 @@ class SchedStateProvider(sp.StateProvider):
         p.pid = pid
         p.comm = name
 
+    def _process_syscall_entry(self, event):
+        if not self.get_field_plan(event).ctx_pid:
+            return
+        cpu_id = event["cpu_id"]
+        if cpu_id not in self.cpus:
+            return
+        c = self.cpus[cpu_id]
+        if c.current_tid == -1:
+            return
+        t = self.tids[c.current_tid]
+        if t.pid == -1 and event["pid"] != t.tid:
+            t.pid = event["pid"]
+            # don't drop what is already known about the parent
+            if t.pid in self.tids:
+                return
+            p = sv.Process()
+            p.tid = t.pid
+            p.pid = t.pid
+            p.comm = t.comm
+            self.tids[p.pid] = p
+
     def dup_fd(self, fd):
         f = sv.FD()
         f.filename = fd.filename
@@ -287,7 +323,7 @@ class SchedStateProvider(sp.StateProvider):
             self.tids[tid] = p
         else:
             p = self.tids[tid]
-        if "procname" in event.keys():
+        if self.get_field_plan(event).procname:
             p.comm = event["procname"]
         toremove = []
         for fd in p.fds.keys():
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+#
+# The MIT License (MIT)
+#
+# Copyright (C) 2015 - Julien Desfossez <jdesfosez@efficios.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import os
+import pickle
+import struct
+import zlib
+
+# bump when the layout of State or of the sv classes changes
+SNAPSHOT_VERSION = 11
+SNAPSHOT_MAGIC = b'LTTNGSNP'
+# magic, version, timestamp of the first event not in the state
+SNAPSHOT_HEADER = struct.Struct('>8sIQ')
+
+
+def write(path, state, ts):
+    """Save state, built from all the events before ts, to path"""
+    data = zlib.compress(pickle.dumps(state, pickle.HIGHEST_PROTOCOL))
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, ts))
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def read(path):
+    """Load a snapshot, returns (timestamp, state) or None if it is not
+    a snapshot this version can load"""
+    with open(path, 'rb') as f:
+        ts = _read_header(f)
+        if ts is None:
+            return None
+        state = pickle.loads(zlib.decompress(f.read()))
+    return ts, state
+
+
+def _read_header(f):
+    hdr = f.read(SNAPSHOT_HEADER.size)
+    if len(hdr) < SNAPSHOT_HEADER.size:
+        return None
+    magic, version, ts = SNAPSHOT_HEADER.unpack(hdr)
+    if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+        return None
+    return ts
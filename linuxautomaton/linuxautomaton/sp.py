@@ -22,6 +22,77 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+from babeltrace import CTFScope
+
+
+def is_syscall_entry(name):
+    return name.startswith("sys_") or name.startswith("syscall_entry_")
+
+
+def is_syscall_exit(name):
+    return name.startswith("exit_syscall") or \
+        name.startswith("syscall_exit_")
+
+
+class FieldPlan:
+    """Context fields present in an event declaration"""
+    __slots__ = ['perf', 'ctx_pid', 'tid', 'procname', 'nr_dirty']
+
+    def __init__(self, event):
+        context = event.field_list_with_scope(CTFScope.STREAM_EVENT_CONTEXT)
+        payload = event.field_list_with_scope(CTFScope.EVENT_FIELDS)
+        keys = event.keys()
+        self.perf = tuple(c for c in context if c.startswith("perf_"))
+        # the "pid" context is only usable if the payload has no
+        # "pid" field, otherwise we might clash
+        self.ctx_pid = "pid" in context and "pid" not in payload
+        self.tid = "tid" in keys
+        self.procname = "procname" in keys
+        self.nr_dirty = "nr_dirty" in keys
+
+
+class FieldPlans:
+    """FieldPlan of the event declarations of the opened trace, the
+    fields are only listed the first time a declaration is seen.
+
+    An event enabled in several channels has one declaration per
+    stream class, each with the contexts of its channel.
+
+    The trace handle ids are only unique in a TraceCollection, the
+    plans must be cleared when the trace is reopened."""
+
+    def __init__(self):
+        # (trace handle id, stream class id, event name) -> FieldPlan
+        self._plans = {}
+
+    def get(self, event):
+        key = (event.handle.id,
+               event.field_with_scope("stream_id",
+                                      CTFScope.TRACE_PACKET_HEADER),
+               event.name)
+        plan = self._plans.get(key)
+        if plan is None:
+            plan = FieldPlan(event)
+            self._plans[key] = plan
+        return plan
+
+    def clear(self):
+        self._plans.clear()
+
+
+def get_event_cbs(cbs, name):
+    """Returns the list of callbacks from the cbs dict that must be
+    called for events named `name`"""
+    ret = []
+    if name in cbs:
+        ret.append(cbs[name])
+    # for now we process all the syscalls at the same place
+    if "syscall_entry" in cbs and is_syscall_entry(name):
+        ret.append(cbs["syscall_entry"])
+    if "syscall_exit" in cbs and is_syscall_exit(name):
+        ret.append(cbs["syscall_exit"])
+    return ret
+
 
 class StateProvider:
     def process_event(self, ev):
@@ -30,16 +101,21 @@ class StateProvider:
     def _register_cbs(self, cbs):
         self._cbs = cbs
 
+    def _set_field_plans(self, field_plans):
+        self._field_plans = field_plans
+
+    def get_field_plan(self, event):
+        return self._field_plans.get(event)
+
+    def evict_history(self):
+        """Drop the per-event history kept for the current refresh
+        window (logs of completed requests), the counters and what is
+        in progress are kept"""
+        pass
+
+    def get_event_cbs(self, name):
+        return get_event_cbs(self._cbs, name)
+
     def _process_event_cb(self, ev):
-        name = ev.name
-
-        if name in self._cbs:
-            self._cbs[name](ev)
-        # for now we process all the syscalls at the same place
-        if "syscall_entry" in self._cbs and \
-                (name.startswith("sys_") or name.startswith("syscall_entry_")):
-            self._cbs["syscall_entry"](ev)
-        if "syscall_exit" in self._cbs and \
-                (name.startswith("exit_syscall") or
-                 name.startswith("syscall_exit_")):
-            self._cbs["syscall_exit"](ev)
+        for cb in self.get_event_cbs(ev.name):
+            cb(ev)
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+#
+# The MIT License (MIT)
+#
+# Copyright (C) 2015 - Julien Desfossez <jdesfosez@efficios.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import math
+
+
+class LatencyStats():
+    # Running statistics of a stream of durations: count, total,
+    # min/max, Welford mean/variance and a log-bucketed histogram
+    # to answer quantile queries. Nothing about individual values
+    # is kept, and two instances can be merged (per-window or
+    # per-worker accumulators).
+    __slots__ = ['count', 'total', 'min', 'max', 'mean', '_m2', 'buckets']
+
+    # relative error of the quantiles and of the bucketed values
+    ACCURACY = 0.01
+    _GAMMA = (1 + ACCURACY) / (1 - ACCURACY)
+    _LOG_GAMMA = math.log(_GAMMA)
+    # bucket of the values <= 0
+    ZERO_BUCKET = -(2 ** 31)
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+        self.mean = 0.0
+        self._m2 = 0.0
+        # bucket index -> number of values
+        self.buckets = {}
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+        if value > 0:
+            b = math.ceil(math.log(value) / self._LOG_GAMMA)
+        else:
+            b = self.ZERO_BUCKET
+        self.buckets[b] = self.buckets.get(b, 0) + 1
+
+    def merge(self, other):
+        if other.count == 0:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self._m2 += other._m2 + delta * delta * self.count * other.count / \
+            count
+        self.mean += delta * other.count / count
+        self.count = count
+        self.total += other.total
+        if self.min is None or other.min < self.min:
+            self.min = other.min
+        if self.max is None or other.max > self.max:
+            self.max = other.max
+        for b, n in other.buckets.items():
+            self.buckets[b] = self.buckets.get(b, 0) + n
+
+    def stdev(self):
+        # sample standard deviation, like statistics.stdev()
+        if self.count < 2:
+            return None
+        return math.sqrt(self._m2 / (self.count - 1))
+
+    def _bucket_value(self, b):
+        if b == self.ZERO_BUCKET:
+            value = 0
+        else:
+            value = 2 * self._GAMMA ** b / (self._GAMMA + 1)
+        # the extremes are known exactly
+        return min(max(value, self.min), self.max)
+
+    def values(self):
+        # (approximate value, number of values) in increasing order
+        for b in sorted(self.buckets.keys()):
+            yield (self._bucket_value(b), self.buckets[b])
+
+    def histogram(self, res, scale=1, log=False):
+        # see histogram(), on the values divided by scale
+        if self.count == 0:
+            return None
+        return histogram(((v / scale, n) for v, n in self.values()),
+                         self.min / scale, self.max / scale, res, log)
+
+    def quantile(self, q):
+        if self.count == 0:
+            return None
+        rank = max(1, math.ceil(q * self.count))
+        # the extremes are known exactly
+        if rank == 1:
+            return self.min
+        if rank >= self.count:
+            return self.max
+        seen = 0
+        for value, n in self.values():
+            seen += n
+            if seen >= rank:
+                return value
+        return self.max
+
+
+def histogram(values, lo, hi, res, log=False):
+    """Distribution of the (value, count) pairs of values, between lo and
+    hi, over res buckets as a list of (lower bound, count). The buckets
+    have the same width, or with log each one is wider than the previous
+    one by the same factor (the values <= 0 go in the first one).
+    Returns None if lo and hi are too close to make res buckets"""
+    counts = [0] * res
+    if log:
+        if hi <= 0:
+            return None
+        if lo <= 0:
+            # log scale from the smallest positive value
+            values = list(values)
+            lo = min((v for v, n in values if v > 0), default=hi)
+        factor = (hi / lo) ** (1 / res)
+        if factor <= 1:
+            return None
+        log_factor = math.log(factor)
+        for v, n in values:
+            if v <= lo:
+                b = 0
+            else:
+                b = min(int(math.log(v / lo) / log_factor), res - 1)
+            counts[b] += n
+        return [(lo * factor ** i, counts[i]) for i in range(res)]
+    step = (hi - lo) / res
+    if step == 0:
+        return None
+    for v, n in values:
+        counts[min(int((v - lo) / step), res - 1)] += n
+    return [(i * step + lo, counts[i]) for i in range(res)]
@@ -23,6 +23,9 @@
 # SOFTWARE.
 
 import socket
+from array import array
+from collections import deque, OrderedDict
+from linuxautomaton.stats import LatencyStats
 
 
 class StateVariable:
@@ -30,6 +33,20 @@ class StateVariable:
 
 
 class Process():
+    # one instance per thread, no per-instance __dict__
+    __slots__ = ['tid', 'pid', 'comm', 'fds', 'closed_fds',
+                 'current_syscall', 'cpu_ns', 'migrate_count', 'net_read',
+                 'net_write', 'disk_read', 'disk_write', 'block_read',
+                 'block_write', 'unk_read', 'unk_write', 'read', 'write',
+                 'last_sched', 'prev_tid', 'syscalls', 'perf', 'dirty',
+                 'allocated_pages', 'freed_pages', 'total_syscalls',
+                 'iorequests', 'sched_latency']
+    # counters summed when merging the same process seen by two automata
+    COUNTERS = ['cpu_ns', 'migrate_count', 'net_read', 'net_write',
+                'disk_read', 'disk_write', 'block_read', 'block_write',
+                'unk_read', 'unk_write', 'read', 'write', 'dirty',
+                'allocated_pages', 'freed_pages', 'total_syscalls']
+
     def __init__(self):
         self.tid = -1
         self.pid = -1
@@ -70,9 +87,47 @@ class Process():
         self.allocated_pages = 0
         self.freed_pages = 0
         self.total_syscalls = 0
-        # array of IORequest objects for freq analysis later (block and
+        # IORequestStore rows for freq analysis later (block and
         # syscalls with no FD like sys_sync)
-        self.iorequests = []
+        self.iorequests = array('I')
+        # wakeup to schedule-in delays
+        self.sched_latency = LatencyStats()
+
+    def merge(self, other):
+        """Merge other, the same process seen in other trace streams"""
+        # the most recently scheduled side knows the current name
+        if other.last_sched is not None and \
+                (self.last_sched is None or
+                 other.last_sched > self.last_sched):
+            self.last_sched = other.last_sched
+            self.prev_tid = other.prev_tid
+            if other.comm:
+                self.comm = other.comm
+        if not self.comm:
+            self.comm = other.comm
+        if self.pid == -1:
+            self.pid = other.pid
+        for counter in Process.COUNTERS:
+            setattr(self, counter,
+                    getattr(self, counter) + getattr(other, counter))
+        for context in other.perf.keys():
+            self.perf[context] = self.perf.get(context, 0) + \
+                other.perf[context]
+        for name in other.syscalls.keys():
+            if name not in self.syscalls:
+                self.syscalls[name] = other.syscalls[name]
+            else:
+                self.syscalls[name].merge(other.syscalls[name])
+        for fd in other.fds.keys():
+            if fd not in self.fds:
+                self.fds[fd] = other.fds[fd]
+        for filename in other.closed_fds.keys():
+            if filename not in self.closed_fds:
+                self.closed_fds[filename] = other.closed_fds[filename]
+            else:
+                self.closed_fds[filename].merge(other.closed_fds[filename])
+        self.iorequests += other.iorequests
+        self.sched_latency.merge(other.sched_latency)
 
 
 class CPU():
@@ -82,7 +137,21 @@ class CPU():
         self.current_tid = -1
         self.start_task_ns = 0
         self.perf = {}
-        self.wakeup_queue = []
+        # timestamp of the pending wakeups targeting this CPU, by tid
+        # and oldest first
+        self.wakeups = OrderedDict()
+
+    def merge(self, other):
+        """Merge other, the same CPU seen in other trace streams"""
+        self.cpu_ns += other.cpu_ns
+        # only the streams of this CPU know what it is running
+        if self.current_tid == -1 and self.start_task_ns == 0:
+            self.current_tid = other.current_tid
+            self.start_task_ns = other.start_task_ns
+        if not self.perf:
+            self.perf = other.perf
+        for tid, ts in other.wakeups.items():
+            self.wakeups.setdefault(tid, ts)
 
 
 class Syscall():
@@ -90,6 +159,9 @@ class Syscall():
         self.name = ""
         self.count = 0
 
+    def merge(self, other):
+        self.count += other.count
+
 
 class Disk():
     def __init__(self):
@@ -103,13 +175,19 @@ class Disk():
         self.completed_requests = 0
         self.request_time = 0
         self.pending_requests = {}
-        self.rq_list = []
-        self.max = None
-        self.min = None
-        self.total = None
-        self.count = None
-        self.rq_values = None
-        self.stdev = None
+        # IORequestStore rows of the completed requests
+        self.rq_list = array('I')
+        # per-sector latency of the completed requests
+        self.latency = LatencyStats()
+
+    def merge(self, other):
+        self.nr_sector += other.nr_sector
+        self.nr_requests += other.nr_requests
+        self.completed_requests += other.completed_requests
+        self.request_time += other.request_time
+        self.pending_requests.update(other.pending_requests)
+        self.rq_list += other.rq_list
+        self.latency.merge(other.latency)
 
 
 class Iface():
@@ -123,6 +201,12 @@ class Iface():
         self.send_bytes = 0
         self.send_packets = 0
 
+    def merge(self, other):
+        self.recv_bytes += other.recv_bytes
+        self.recv_packets += other.recv_packets
+        self.send_bytes += other.send_bytes
+        self.send_packets += other.send_packets
+
 
 class FDType():
     unknown = 0
@@ -134,6 +218,11 @@ class FDType():
 
 
 class FD():
+    __slots__ = ['filename', 'fd', 'family', 'fdtype', 'parent', 'net_read',
+                 'net_write', 'disk_read', 'disk_write', 'unk_read',
+                 'unk_write', 'read', 'write', 'open', 'close', 'cloexec',
+                 'iorequests']
+
     def __init__(self):
         self.filename = ""
         self.fd = -1
@@ -160,11 +249,26 @@ class FD():
         self.open = 0
         self.close = 0
         self.cloexec = 0
-        # array of syscall IORequest objects for freq analysis later
-        self.iorequests = []
+        # IORequestStore rows of the syscalls for freq analysis later
+        self.iorequests = array('I')
+
+    def merge(self, other):
+        self.net_read += other.net_read
+        self.net_write += other.net_write
+        self.disk_read += other.disk_read
+        self.disk_write += other.disk_write
+        self.unk_read += other.unk_read
+        self.unk_write += other.unk_write
+        self.read += other.read
+        self.write += other.write
+        self.open += other.open
+        self.close += other.close
+        self.iorequests += other.iorequests
 
 
 class IRQ():
+    __slots__ = ['nr', 'irqclass', 'start_ts', 'stop_ts', 'raise_ts',
+                 'cpu_id', 'ret']
     HARD_IRQ = 1
     SOFT_IRQ = 2
     # from include/linux/interrupt.h
@@ -186,11 +290,14 @@ class IRQ():
         self.stop_ts = -1
         self.raise_ts = -1
         self.cpu_id = -1
+        # return value of the handler (hard IRQs)
+        self.ret = None
 
     # used to track statistics about individual IRQs
     def init_irq_instance():
         irq = {}
-        irq["list"] = []
+        irq["duration"] = LatencyStats()
+        irq["raise"] = LatencyStats()
         irq["max"] = 0
         irq["min"] = -1
         irq["count"] = 0
@@ -201,8 +308,28 @@ class IRQ():
         irq["raise_total"] = 0
         return irq
 
+    def merge_irq_instance(irq, other):
+        irq["duration"].merge(other["duration"])
+        irq["raise"].merge(other["raise"])
+        irq["count"] += other["count"]
+        irq["total"] += other["total"]
+        irq["max"] = max(irq["max"], other["max"])
+        if irq["min"] == -1 or (other["min"] != -1 and
+                                other["min"] < irq["min"]):
+            irq["min"] = other["min"]
+        irq["raise_count"] += other["raise_count"]
+        irq["raise_total"] += other["raise_total"]
+        irq["raise_max"] = max(irq["raise_max"], other["raise_max"])
+        if irq["raise_min"] == -1 or (other["raise_min"] != -1 and
+                                      other["raise_min"] < irq["raise_min"]):
+            irq["raise_min"] = other["raise_min"]
+
 
 class IORequest():
+    # allocated for every I/O syscall and block request
+    __slots__ = ['iotype', 'size', 'duration', 'operation', 'name', 'begin',
+                 'end', 'proc', 'fd', 'dirty', 'page_alloc', 'page_free',
+                 'page_written', 'woke_kswapd', 'page_cleared']
     # I/O "type"
     IO_SYSCALL = 1
     IO_BLOCK = 2
@@ -249,74 +376,318 @@ class IORequest():
         self.page_cleared = 0
 
 
-class Syscalls_stats():
+class IORequestStore():
+    """Append-only, column-oriented storage of the completed IORequests.
+
+    An IORequest object only lives while the request is in flight, once
+    completed it is copied here and the FDs, processes and disks keep
+    its row number instead of the object."""
+    # size of the requests that don't have one
+    NO_SIZE = -1
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.iotype = array('b')
+        self.operation = array('b')
+        self.begin = array('q')
+        self.end = array('q')
+        self.duration = array('d')
+        self.size = array('q')
+        # index in self.names
+        self.name = array('H')
+        self.dirty = array('i')
+        self.page_alloc = array('i')
+        self.page_free = array('i')
+        self.page_written = array('l')
+        self.woke_kswapd = array('b')
+        self.page_cleared = array('i')
+        # objects are shared with the rest of the state
+        self.proc = []
+        self.fd = []
+        self.names = [None]
+        self._name_ids = {None: 0}
+
+    def __len__(self):
+        return len(self.begin)
+
+    def _name_id(self, name):
+        name_id = self._name_ids.get(name)
+        if name_id is None:
+            name_id = len(self.names)
+            self.names.append(name)
+            self._name_ids[name] = name_id
+        return name_id
+
+    def append(self, rq):
+        """Store the completed request rq, returns its row"""
+        row = len(self.begin)
+        self.iotype.append(rq.iotype or 0)
+        self.operation.append(rq.operation or 0)
+        self.begin.append(rq.begin)
+        self.end.append(rq.end)
+        self.duration.append(rq.duration)
+        if rq.size is None:
+            self.size.append(IORequestStore.NO_SIZE)
+        else:
+            self.size.append(rq.size)
+        self.name.append(self._name_id(rq.name))
+        self.dirty.append(rq.dirty)
+        self.page_alloc.append(rq.page_alloc)
+        self.page_free.append(rq.page_free)
+        self.page_written.append(rq.page_written)
+        self.woke_kswapd.append(rq.woke_kswapd)
+        self.page_cleared.append(rq.page_cleared)
+        self.proc.append(rq.proc)
+        self.fd.append(rq.fd)
+        return row
+
+    def get(self, row):
+        """IORequest object for row (for display)"""
+        rq = IORequest()
+        rq.iotype = self.iotype[row] or None
+        rq.operation = self.operation[row] or None
+        rq.begin = self.begin[row]
+        rq.end = self.end[row]
+        rq.duration = self.duration[row]
+        if self.size[row] != IORequestStore.NO_SIZE:
+            rq.size = self.size[row]
+        rq.name = self.names[self.name[row]]
+        rq.dirty = self.dirty[row]
+        rq.page_alloc = self.page_alloc[row]
+        rq.page_free = self.page_free[row]
+        rq.page_written = self.page_written[row]
+        rq.woke_kswapd = bool(self.woke_kswapd[row])
+        rq.page_cleared = self.page_cleared[row]
+        rq.proc = self.proc[row]
+        rq.fd = self.fd[row]
+        return rq
+
+    def extend(self, other):
+        """Append the rows of other, returns the offset to add to its row
+        numbers"""
+        offset = len(self.begin)
+        for column in ['iotype', 'operation', 'begin', 'end', 'duration',
+                       'size', 'dirty', 'page_alloc', 'page_free',
+                       'page_written', 'woke_kswapd', 'page_cleared', 'proc',
+                       'fd']:
+            getattr(self, column).extend(getattr(other, column))
+        for name_id in other.name:
+            self.name.append(self._name_id(other.names[name_id]))
+        return offset
+
+
+class DirtyPageQueue():
+    """Dirty pages (proc, syscall name, filename, fd) in the order they
+    were dirtied.
+
+    The pages are also indexed per (fd, tid) and (fd, pid) of the
+    process that dirtied them (as known at that time), so that clearing
+    the pages of one file costs the number of pages cleared. Removed
+    pages are only flagged, and dropped lazily from the queue and the
+    indexes."""
     def __init__(self):
-        self.read_max = 0
-        self.read_min = None
-        self.read_total = 0
-        self.read_count = 0
-        self.read_rq = []
-        self.all_read = []
-
-        self.write_max = 0
-        self.write_min = None
-        self.write_total = 0
-        self.write_count = 0
-        self.write_rq = []
-        self.all_write = []
-
-        self.open_max = 0
-        self.open_min = None
-        self.open_total = 0
-        self.open_count = 0
-        self.open_rq = []
-        self.all_open = []
-
-        self.sync_max = 0
-        self.sync_min = None
-        self.sync_total = 0
-        self.sync_count = 0
-        self.sync_rq = []
-        self.all_sync = []
+        # entries are [seq, page, live, pid]
+        self._queue = deque()
+        self._by_tid = {}
+        self._by_pid = {}
+        self._seq = 0
+        self._len = 0
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        for entry in self._queue:
+            if entry[2]:
+                yield entry[1]
+
+    def _index(self, entry):
+        fd = entry[1][3]
+        self._by_tid.setdefault((fd, entry[1][0].tid), deque()).append(entry)
+        self._by_pid.setdefault((fd, entry[3]), deque()).append(entry)
+
+    def append(self, page):
+        entry = [self._seq, page, True, page[0].pid]
+        self._seq += 1
+        self._len += 1
+        self._queue.append(entry)
+        self._index(entry)
+
+    def extend(self, pages):
+        for page in pages:
+            self.append(page)
+
+    def _drop_head(self, index, key):
+        q = index.get(key)
+        if q is None:
+            return
+        while q and not q[0][2]:
+            q.popleft()
+        if not q:
+            del index[key]
+
+    def popleft(self):
+        while True:
+            entry = self._queue.popleft()
+            if entry[2]:
+                break
+        entry[2] = False
+        self._len -= 1
+        # the entries before it in its indexes are dead too
+        fd = entry[1][3]
+        self._drop_head(self._by_tid, (fd, entry[1][0].tid))
+        self._drop_head(self._by_pid, (fd, entry[3]))
+        return entry[1]
+
+    def pop_all(self):
+        pages = list(self)
+        self.__init__()
+        return pages
+
+    def pop_matching(self, fd, tid, pid):
+        """Remove and return, oldest first, the pages dirtied on fd by
+        the thread tid or by a thread of the process pid"""
+        entries = [e for e in self._by_tid.pop((fd, tid), ()) if e[2]]
+        entries += [e for e in self._by_pid.pop((fd, pid), ())
+                    if e[2] and e[1][0].tid != tid]
+        entries.sort(key=lambda e: e[0])
+        for e in entries:
+            e[2] = False
+        self._len -= len(entries)
+        # don't let the flagged entries pile up
+        if len(self._queue) > 2 * self._len + 1024:
+            self._compact()
+        return [e[1] for e in entries]
+
+    def _compact(self):
+        self._queue = deque(e for e in self._queue if e[2])
+        self._by_tid = {}
+        self._by_pid = {}
+        for entry in self._queue:
+            self._index(entry)
+
+
+class Syscalls_stats():
+    def __init__(self, keep_rows=True):
+        # the all_* lists of IORequestStore rows are None when only the
+        # statistics are needed
+        self.read = LatencyStats()
+        self.all_read = [] if keep_rows else None
+
+        self.write = LatencyStats()
+        self.all_write = [] if keep_rows else None
+
+        self.open = LatencyStats()
+        self.all_open = [] if keep_rows else None
+
+        self.sync = LatencyStats()
+        self.all_sync = [] if keep_rows else None
+
+
+class SyscallInfo():
+    """Classification of one syscall name, see SyscallConsts.get_info()"""
+    __slots__ = ['name', 'base', 'open', 'disk_open', 'net_open', 'dup',
+                 'close', 'read', 'write', 'sync', 'sync_all', 'fd_pair',
+                 'count_field']
+
+    def __init__(self, name):
+        self.name = name
+        # the name without the tracer prefix
+        self.base = name
+        for prefix in SyscallConsts.PREFIXES:
+            if name.startswith(prefix):
+                self.base = name[len(prefix):]
+                break
+        self.open = name in SyscallConsts.OPEN_SYSCALLS
+        self.disk_open = name in SyscallConsts.DISK_OPEN_SYSCALLS
+        self.net_open = name in SyscallConsts.NET_OPEN_SYSCALLS
+        self.dup = name in SyscallConsts.DUP_OPEN_SYSCALLS
+        self.close = name in SyscallConsts.CLOSE_SYSCALLS
+        self.read = name in SyscallConsts.READ_SYSCALLS
+        self.write = name in SyscallConsts.WRITE_SYSCALLS
+        self.sync = name in SyscallConsts.SYNC_SYSCALLS
+        # sync() flushes everything, the others have an FD
+        self.sync_all = self.sync and self.base == "sync"
+        # (input, output) FD fields of the syscalls moving data
+        # between two FDs
+        self.fd_pair = SyscallConsts.FD_PAIR_FIELDS.get(self.base)
+        self.count_field = SyscallConsts.COUNT_FIELDS.get(self.base, "count")
 
 
 class SyscallConsts():
+    # old (sys_) and new (syscall_entry_) tracer event names
+    PREFIXES = ["syscall_entry_", "sys_"]
     # TODO: decouple socket/family logic from this class
-    INET_FAMILIES = [socket.AF_INET, socket.AF_INET6]
-    DISK_FAMILIES = [socket.AF_UNIX]
+    INET_FAMILIES = frozenset([socket.AF_INET, socket.AF_INET6])
+    DISK_FAMILIES = frozenset([socket.AF_UNIX])
     # list nof syscalls that open a FD on disk (in the exit_syscall event)
-    DISK_OPEN_SYSCALLS = ["sys_open", "syscall_entry_open",
-                          "sys_openat", "syscall_entry_openat"]
+    DISK_OPEN_SYSCALLS = frozenset(["sys_open", "syscall_entry_open",
+                                    "sys_openat", "syscall_entry_openat"])
     # list of syscalls that open a FD on the network
     # (in the exit_syscall event)
-    NET_OPEN_SYSCALLS = ["sys_accept", "syscall_entry_accept",
-                         "sys_socket", "syscall_entry_socket"]
+    NET_OPEN_SYSCALLS = frozenset(["sys_accept", "syscall_entry_accept",
+                                   "sys_socket", "syscall_entry_socket"])
     # list of syscalls that can duplicate a FD
-    DUP_OPEN_SYSCALLS = ["sys_fcntl", "syscall_entry_fcntl",
-                         "sys_dup2", "syscall_entry_dup2"]
-    SYNC_SYSCALLS = ["sys_sync", "syscall_entry_sync",
-                     "sys_sync_file_range", "syscall_entry_sync_file_range",
-                     "sys_fsync", "syscall_entry_fsync",
-                     "sys_fdatasync", "syscall_entry_fdatasync"]
+    DUP_OPEN_SYSCALLS = frozenset(["sys_fcntl", "syscall_entry_fcntl",
+                                   "sys_dup2", "syscall_entry_dup2"])
+    SYNC_SYSCALLS = frozenset(["sys_sync", "syscall_entry_sync",
+                               "sys_sync_file_range",
+                               "syscall_entry_sync_file_range",
+                               "sys_fsync", "syscall_entry_fsync",
+                               "sys_fdatasync", "syscall_entry_fdatasync"])
     # merge the 3 open lists
-    OPEN_SYSCALLS = DISK_OPEN_SYSCALLS + NET_OPEN_SYSCALLS + DUP_OPEN_SYSCALLS
+    OPEN_SYSCALLS = DISK_OPEN_SYSCALLS | NET_OPEN_SYSCALLS | DUP_OPEN_SYSCALLS
     # list of syscalls that close a FD (in the "fd =" field)
-    CLOSE_SYSCALLS = ["sys_close", "syscall_entry_close"]
+    CLOSE_SYSCALLS = frozenset(["sys_close", "syscall_entry_close"])
     # list of syscall that read on a FD, value in the exit_syscall following
-    READ_SYSCALLS = ["sys_read", "syscall_entry_read",
-                     "sys_recvmsg", "syscall_entry_recvmsg",
-                     "sys_recvfrom", "syscall_entry_recvfrom",
-                     "sys_splice", "syscall_entry_splice",
-                     "sys_readv", "syscall_entry_readv",
-                     "sys_sendfile64", "syscall_entry_sendfile64"]
+    READ_SYSCALLS = frozenset(["sys_read", "syscall_entry_read",
+                               "sys_recvmsg", "syscall_entry_recvmsg",
+                               "sys_recvfrom", "syscall_entry_recvfrom",
+                               "sys_splice", "syscall_entry_splice",
+                               "sys_readv", "syscall_entry_readv",
+                               "sys_sendfile64", "syscall_entry_sendfile64",
+                               "sys_pread64", "syscall_entry_pread64",
+                               "sys_preadv", "syscall_entry_preadv"])
     # list of syscall that write on a FD, value in the exit_syscall following
-    WRITE_SYSCALLS = ["sys_write", "syscall_entry_write",
-                      "sys_sendmsg", "syscall_entry_sendmsg",
-                      "sys_sendto", "syscall_entry_sendto",
-                      "sys_writev", "syscall_entry_writev"]
+    WRITE_SYSCALLS = frozenset(["sys_write", "syscall_entry_write",
+                                "sys_sendmsg", "syscall_entry_sendmsg",
+                                "sys_sendto", "syscall_entry_sendto",
+                                "sys_writev", "syscall_entry_writev",
+                                "sys_pwrite64", "syscall_entry_pwrite64",
+                                "sys_pwritev", "syscall_entry_pwritev"])
     # generic names assigned to special FDs, don't try to match these in the
     # closed_fds dict
-    GENERIC_NAMES = ["unknown", "socket"]
+    GENERIC_NAMES = frozenset(["unknown", "socket"])
+    # count argument of the read/write syscalls when it is not "count"
+    # (None: no usable count)
+    COUNT_FIELDS = {
+        "readv": "vlen",
+        "writev": "vlen",
+        "preadv": "vlen",
+        "pwritev": "vlen",
+        "recvfrom": "size",
+        "recvmsg": None,
+        "sendmsg": None,
+        "sendto": "len",
+        "splice": "len",
+    }
+    # syscalls moving data between two FDs: (input FD, output FD) fields
+    FD_PAIR_FIELDS = {
+        "splice": ("fd_in", "fd_out"),
+        "sendfile64": ("in_fd", "out_fd"),
+    }
+    # cache of SyscallInfo, by name
+    _infos = {}
+
+    @staticmethod
+    def get_info(name):
+        info = SyscallConsts._infos.get(name)
+        if info is None:
+            info = SyscallInfo(name)
+            SyscallConsts._infos[name] = info
+        return info
 
     def __init__():
         pass
@@ -24,8 +24,8 @@
 
 import socket
 import operator
+from array import array
 from linuxautomaton import sp, sv, common
-from babeltrace import CTFScope
 
 
 class IOCategory():
@@ -48,8 +48,15 @@ class SyscallsStateProvider(sp.StateProvider):
         self.tids = state.tids
         self.syscalls = state.syscalls
         self.pending_syscalls = state.pending_syscalls
-        self.syscalls["total"] = 0
+        self.iorequests = state.iorequests
+        self.syscalls.setdefault("total", 0)
         self.dirty_pages = state.dirty_pages
+        self.mm = state.mm
+        self.mm.setdefault("alloc_events", 0)
+        # processes which may have "wakeup_kswapd" in their current
+        # syscall, see _process_mm_page_free()
+        self._kswapd_procs = set(p for p in self.tids.values()
+                                 if "wakeup_kswapd" in p.current_syscall)
         cbs = {
             'syscall_entry': self._process_syscall_entry,
             'syscall_exit': self._process_syscall_exit,
@@ -59,6 +66,19 @@ class SyscallsStateProvider(sp.StateProvider):
         }
         self._register_cbs(cbs)
 
+    def evict_history(self):
+        # the closed FDs stay: a new open of the same file reuses them,
+        # and they are shared with the fds of the forked processes, so
+        # dropping one changes the attribution of the next windows.
+        # There is one per file a process closed, they grow with the
+        # set of files and not with the number of events.
+        for proc in self.tids.values():
+            proc.iorequests = array('I')
+            for fd in proc.fds.values():
+                fd.iorequests = array('I')
+            for fd in proc.closed_fds.values():
+                fd.iorequests = array('I')
+
     def process_event(self, ev):
         self._process_event_cb(ev)
 
@@ -68,25 +88,26 @@ class SyscallsStateProvider(sp.StateProvider):
 
         This is used to produce json data for visualization"""
 
-        if name in sv.SyscallConsts.OPEN_SYSCALLS:
+        info = sv.SyscallConsts.get_info(name)
+        if info.open:
             return IOCategory.opn
-        if name in sv.SyscallConsts.CLOSE_SYSCALLS:
+        if info.close:
             return IOCategory.close
-        if name in sv.SyscallConsts.READ_SYSCALLS:
+        if info.read:
             return IOCategory.read
-        if name in sv.SyscallConsts.WRITE_SYSCALLS:
+        if info.write:
             return IOCategory.write
 
         return IOCategory.invalid
 
-    def get_fd_type(self, name, family):
-        if name in sv.SyscallConsts.NET_OPEN_SYSCALLS:
+    def get_fd_type(self, info, family):
+        if info.net_open:
             if family in sv.SyscallConsts.INET_FAMILIES:
                 return sv.FDType.net
             if family in sv.SyscallConsts.DISK_FAMILIES:
                 return sv.FDType.disk
 
-        if name in sv.SyscallConsts.DISK_OPEN_SYSCALLS:
+        if info.disk_open:
             return sv.FDType.disk
 
         return sv.FDType.unknown
@@ -119,23 +140,30 @@ class SyscallsStateProvider(sp.StateProvider):
             s = t.syscalls[name]
         s.count += 1
 
-    def track_open(self, name, proc, event, cpu):
+    def syscall_started(self, current_syscall):
+        # The pages allocated while a syscall is in progress are the
+        # difference of the global counter, taken when current_syscall
+        # stops being empty (a current_syscall left over by an
+        # unfinished syscall keeps counting).
+        current_syscall.setdefault("alloc_base", self.mm["alloc_events"])
+
+    def track_open(self, name, info, proc, event, cpu):
         self.tids[cpu.current_tid].current_syscall = {}
         current_syscall = self.tids[cpu.current_tid].current_syscall
-        if name in sv.SyscallConsts.DISK_OPEN_SYSCALLS:
+        if info.disk_open:
             current_syscall["filename"] = event["filename"]
             if event["flags"] & common.O_CLOEXEC == common.O_CLOEXEC:
                 current_syscall["cloexec"] = 1
-        elif name in ["sys_accept", "syscall_entry_accept"]:
+        elif info.base == "accept":
             if "family" in event.keys() and event["family"] == socket.AF_INET:
                 ipport = "%s:%d" % (common.get_v4_addr_str(event["v4addr"]),
                                     event["sport"])
                 current_syscall["filename"] = ipport
             else:
                 current_syscall["filename"] = "socket"
-        elif name in sv.SyscallConsts.NET_OPEN_SYSCALLS:
+        elif info.net_open:
             current_syscall["filename"] = "socket"
-        elif name in ["sys_dup2", "syscall_entry_dup2"]:
+        elif info.base == "dup2":
             newfd = event["newfd"]
             oldfd = event["oldfd"]
             if newfd in proc.fds.keys():
@@ -145,7 +173,7 @@ class SyscallsStateProvider(sp.StateProvider):
                 current_syscall["fdtype"] = proc.fds[oldfd].fdtype
             else:
                 current_syscall["filename"] = ""
-        elif name in ["sys_fcntl", "syscall_entry_fcntl"]:
+        elif info.base == "fcntl":
             # F_DUPsv.FD
             if event["cmd"] != 0:
                 return
@@ -156,8 +184,7 @@ class SyscallsStateProvider(sp.StateProvider):
             else:
                 current_syscall["filename"] = ""
 
-        if name in sv.SyscallConsts.NET_OPEN_SYSCALLS and \
-                "family" in event.keys():
+        if info.net_open and "family" in event.keys():
             family = event["family"]
             current_syscall["family"] = family
         else:
@@ -165,8 +192,10 @@ class SyscallsStateProvider(sp.StateProvider):
             current_syscall["family"] = family
 
         current_syscall["name"] = name
+        current_syscall["info"] = info
         current_syscall["start"] = event.timestamp
-        current_syscall["fdtype"] = self.get_fd_type(name, family)
+        current_syscall["fdtype"] = self.get_fd_type(info, family)
+        self.syscall_started(current_syscall)
 
     def close_fd(self, proc, fd):
         filename = proc.fds[fd].filename
@@ -186,7 +215,7 @@ class SyscallsStateProvider(sp.StateProvider):
 #                    proc.fds[fd].open, proc.fds[fd].close))
         proc.fds.pop(fd, None)
 
-    def track_close(self, name, proc, event, cpu):
+    def track_close(self, name, info, proc, event, cpu):
         fd = event["fd"]
         if fd not in proc.fds.keys():
             return
@@ -196,32 +225,13 @@ class SyscallsStateProvider(sp.StateProvider):
         current_syscall = tid.current_syscall
         current_syscall["filename"] = proc.fds[fd].filename
         current_syscall["name"] = name
+        current_syscall["info"] = info
         current_syscall["start"] = event.timestamp
+        self.syscall_started(current_syscall)
 
         self.close_fd(proc, fd)
 
-    def _fix_context_pid(self, event, t):
-        for context in event.field_list_with_scope(
-                CTFScope.STREAM_EVENT_CONTEXT):
-            if context != "pid":
-                continue
-            # make sure the "pid" field is not also in the event
-            # payload, otherwise we might clash
-            for context in event.field_list_with_scope(
-                    CTFScope.EVENT_FIELDS):
-                if context == "pid":
-                    return
-            if t.pid == -1:
-                t.pid == event["pid"]
-                if event["pid"] != t.tid:
-                    t.pid = event["pid"]
-                    p = sv.Process()
-                    p.tid = t.pid
-                    p.pid = t.pid
-                    p.comm = t.comm
-                    self.tids[p.pid] = p
-
-    def track_fds(self, name, event, cpu_id):
+    def track_fds(self, name, info, event, cpu_id):
         # we don't know which process is currently on this CPU
         ret_string = ""
         if cpu_id not in self.cpus:
@@ -230,22 +240,20 @@ class SyscallsStateProvider(sp.StateProvider):
         if c.current_tid == -1:
             return
         t = self.tids[c.current_tid]
-        # check if we can fix the pid from a context
-        self._fix_context_pid(event, t)
-        # if it's a thread, we want the parent
+        # if it's a thread, we want the parent (its pid is fixed from
+        # the context by the sched provider)
         if t.pid != -1 and t.tid != t.pid:
             t = self.tids[t.pid]
-        if name in sv.SyscallConsts.OPEN_SYSCALLS:
-            self.track_open(name, t, event, c)
-        elif name in sv.SyscallConsts.CLOSE_SYSCALLS:
+        if info.open:
+            self.track_open(name, info, t, event, c)
+        elif info.close:
             ret_string = "%s %s(%d)" % \
                 (common.ns_to_hour_nsec(event.timestamp),
                  name, event["fd"])
-            self.track_close(name, t, event, c)
+            self.track_close(name, info, t, event, c)
         # when a connect occurs, no new sv.FD is returned, but we can fix
         # the "filename" if we have the destination info
-        elif name in ["sys_connect", "syscall_entry_connect"] \
-                and "family" in event.keys():
+        elif info.base == "connect" and "family" in event.keys():
             if event["family"] == socket.AF_INET:
                 fd = self.get_fd(t, event["fd"])
                 ipport = "%s:%d" % (common.get_v4_addr_str(event["v4addr"]),
@@ -263,7 +271,7 @@ class SyscallsStateProvider(sp.StateProvider):
             f = proc.fds[fd]
         return f
 
-    def track_sync(self, name, event, cpu_id):
+    def track_sync(self, name, info, event, cpu_id):
         # we don't know which process is currently on this CPU
         if cpu_id not in self.cpus:
             return
@@ -277,14 +285,16 @@ class SyscallsStateProvider(sp.StateProvider):
             t = self.tids[t.pid]
         current_syscall = self.tids[c.current_tid].current_syscall
         current_syscall["name"] = name
+        current_syscall["info"] = info
         current_syscall["start"] = event.timestamp
-        if name not in ["sys_sync", "syscall_entry_sync"]:
+        self.syscall_started(current_syscall)
+        if not info.sync_all:
             fd = event["fd"]
             f = self.get_fd(t, fd)
             current_syscall["fd"] = f
             current_syscall["filename"] = f.filename
 
-    def track_read_write(self, name, event, cpu_id):
+    def track_read_write(self, name, info, event, cpu_id):
         # we don't know which process is currently on this CPU
         if cpu_id not in self.cpus:
             return
@@ -298,35 +308,24 @@ class SyscallsStateProvider(sp.StateProvider):
             t = self.tids[t.pid]
         current_syscall = self.tids[c.current_tid].current_syscall
         current_syscall["name"] = name
+        current_syscall["info"] = info
         current_syscall["start"] = event.timestamp
-        if name in ["sys_splice", "syscall_entry_splice"]:
-            current_syscall["fd_in"] = self.get_fd(t, event["fd_in"])
-            current_syscall["fd_out"] = self.get_fd(t, event["fd_out"])
-            current_syscall["count"] = event["len"]
-            current_syscall["filename"] = current_syscall["fd_in"].filename
-            return
-        elif name in ["sys_sendfile64", "syscall_entry_sendfile64"]:
-            current_syscall["fd_in"] = self.get_fd(t, event["in_fd"])
-            current_syscall["fd_out"] = self.get_fd(t, event["out_fd"])
-            current_syscall["count"] = event["count"]
+        self.syscall_started(current_syscall)
+        if info.fd_pair is not None:
+            fd_in, fd_out = info.fd_pair
+            current_syscall["fd_in"] = self.get_fd(t, event[fd_in])
+            current_syscall["fd_out"] = self.get_fd(t, event[fd_out])
+            current_syscall["count"] = event[info.count_field]
             current_syscall["filename"] = current_syscall["fd_in"].filename
             return
         fd = event["fd"]
         f = self.get_fd(t, fd)
         current_syscall["fd"] = f
-        if name in ["sys_writev", "syscall_entry_writev",
-                    "sys_readv", "syscall_entry_readv"]:
-            current_syscall["count"] = event["vlen"]
-        elif name in ["sys_recvfrom", "syscall_entry_recvfrom"]:
-            current_syscall["count"] = event["size"]
-        elif name in ["sys_recvmsg", "syscall_entry_recvmsg",
-                      "sys_sendmsg", "syscall_entry_sendmsg"]:
+        if info.count_field is None:
             current_syscall["count"] = ""
-        elif name in ["sys_sendto", "syscall_entry_sendto"]:
-            current_syscall["count"] = event["len"]
         else:
             try:
-                current_syscall["count"] = event["count"]
+                current_syscall["count"] = event[info.count_field]
             except:
                 print("Missing count argument for syscall",
                       current_syscall["name"])
@@ -350,7 +349,7 @@ class SyscallsStateProvider(sp.StateProvider):
         else:
             fd = sv.FD()
             fd.filename = name
-            if current_syscall["name"] in sv.SyscallConsts.NET_OPEN_SYSCALLS:
+            if current_syscall["info"].net_open:
                 fd.family = current_syscall["family"]
                 if fd.family in sv.SyscallConsts.INET_FAMILIES:
                     fd.fdtype = sv.FDType.net
@@ -393,7 +392,7 @@ class SyscallsStateProvider(sp.StateProvider):
         fd.write += count
         proc.write += count
 
-    def track_read_write_return(self, name, ret, cpu):
+    def track_read_write_return(self, info, ret, cpu):
         if ret < 0:
             # TODO: track errors
             return
@@ -402,17 +401,16 @@ class SyscallsStateProvider(sp.StateProvider):
         if proc.pid != -1 and proc.tid != proc.pid:
             proc = self.tids[proc.pid]
         current_syscall = self.tids[cpu.current_tid].current_syscall
-        if name in ["sys_splice", "syscall_entry_splice",
-                    "sys_sendfile64", "syscall_entry_sendfile64"]:
+        if info.fd_pair is not None:
             self.read_append(current_syscall["fd_in"], proc, ret,
                              current_syscall["iorequest"])
             self.write_append(current_syscall["fd_out"], proc, ret,
                               current_syscall["iorequest"])
-        elif name in sv.SyscallConsts.READ_SYSCALLS:
+        elif info.read:
             if ret > 0:
                 self.read_append(current_syscall["fd"], proc, ret,
                                  current_syscall["iorequest"])
-        elif name in sv.SyscallConsts.WRITE_SYSCALLS:
+        elif info.write:
             if ret > 0:
                 self.write_append(current_syscall["fd"], proc, ret,
                                   current_syscall["iorequest"])
@@ -449,25 +447,17 @@ class SyscallsStateProvider(sp.StateProvider):
                 print("%s  - %s : %d pages" % (spaces, f[0], f[1]))
 
     def syscall_clear_pages(self, event, name, fd, current_syscall, tid):
-        cleaned = []
-        if name in ["sys_sync", "syscall_entry_sync"]:
+        if sv.SyscallConsts.get_info(name).sync_all:
             # remove all the pages
-            for i in range(len(self.dirty_pages["pages"])):
-                cleaned.append(self.dirty_pages["pages"].pop(0))
+            cleaned = self.dirty_pages["pages"].pop_all()
         else:
             # remove only the pages that belong to a specific proc/fd
-            for i in range(len(self.dirty_pages["pages"])):
-                proc = self.dirty_pages["pages"][i][0]
-                page_fd = self.dirty_pages["pages"][i][3]
-                if page_fd == fd and (tid.tid == proc.tid or
-                                      tid.pid == proc.pid):
-                    cleaned.append(self.dirty_pages["pages"][i])
-            for i in cleaned:
-                self.dirty_pages["pages"].remove(i)
+            cleaned = self.dirty_pages["pages"].pop_matching(fd, tid.tid,
+                                                             tid.pid)
         if len(cleaned) > 0:
             current_syscall["pages_cleared"] = cleaned
 
-    def track_rw_latency(self, name, ret, c, ts, event):
+    def track_rw_latency(self, info, ret, c, ts, event):
         current_syscall = self.tids[c.current_tid].current_syscall
         rq = current_syscall["iorequest"]
 #       FIXME: useless ?
@@ -479,8 +469,6 @@ class SyscallsStateProvider(sp.StateProvider):
         rq.proc = self.tids[c.current_tid]
         if "fd" in current_syscall.keys():
             rq.fd = current_syscall["fd"]
-            r = current_syscall["fd"].iorequests
-            r.append(current_syscall["iorequest"])
         elif "fd_in" in current_syscall.keys():
             rq.fd = current_syscall["fd_in"]
         # pages written during the latency
@@ -490,18 +478,28 @@ class SyscallsStateProvider(sp.StateProvider):
         if "dirty" in current_syscall.keys():
             rq.dirty = current_syscall["dirty"]
         # alloc pages during the latency
-        if "alloc" in current_syscall.keys():
-            rq.page_alloc = current_syscall["alloc"]
+        if "alloc_base" in current_syscall.keys():
+            rq.page_alloc = self.mm["alloc_events"] - \
+                current_syscall["alloc_base"]
         # wakeup_kswapd during the latency
         if "page_free" in current_syscall.keys():
             rq.page_free = current_syscall["page_free"]
         if "wakeup_kswapd" in current_syscall.keys():
             rq.woke_kswapd = True
-        if name in sv.SyscallConsts.SYNC_SYSCALLS:
+        if info.sync:
 #            self.syscall_clear_pages(event, name, fd, current_syscall,
 #                                     self.tids[c.current_tid])
             if "pages_cleared" in current_syscall.keys():
                 rq.page_cleared = len(current_syscall["pages_cleared"])
+        # only store the requests something refers to
+        row = None
+        if "fd" in current_syscall.keys():
+            row = self.iorequests.append(rq)
+            current_syscall["fd"].iorequests.append(row)
+        if info.sync_all:
+            if row is None:
+                row = self.iorequests.append(rq)
+            self.tids[c.current_tid].iorequests.append(row)
 
     def _process_syscall_entry(self, event):
         name = event.name
@@ -509,12 +507,13 @@ class SyscallsStateProvider(sp.StateProvider):
         cpu_id = event["cpu_id"]
         self.global_syscall_entry(name)
         self.per_tid_syscall_entry(name, cpu_id)
-        ret_string = self.track_fds(name, event, cpu_id)
-        if name in sv.SyscallConsts.READ_SYSCALLS or \
-                name in sv.SyscallConsts.WRITE_SYSCALLS:
-            self.track_read_write(name, event, cpu_id)
-        if name in sv.SyscallConsts.SYNC_SYSCALLS:
-            self.track_sync(name, event, cpu_id)
+        # classified once, kept in current_syscall for the exit
+        info = sv.SyscallConsts.get_info(name)
+        ret_string = self.track_fds(name, info, event, cpu_id)
+        if info.read or info.write:
+            self.track_read_write(name, info, event, cpu_id)
+        if info.sync:
+            self.track_sync(name, info, event, cpu_id)
         return ret_string
 
     def _process_syscall_exit(self, event):
@@ -529,11 +528,12 @@ class SyscallsStateProvider(sp.StateProvider):
         if len(current_syscall.keys()) == 0:
             return
         name = current_syscall["name"]
+        info = current_syscall["info"]
         ret = event["ret"]
         current_syscall["iorequest"] = sv.IORequest()
         current_syscall["iorequest"].iotype = sv.IORequest.IO_SYSCALL
         current_syscall["iorequest"].name = name
-        if name in sv.SyscallConsts.OPEN_SYSCALLS:
+        if info.open:
             self.add_tid_fd(event, c)
             ret_string = "%s %s(%s, fd = %d)" % (
                 common.ns_to_hour_nsec(current_syscall["start"]),
@@ -545,18 +545,14 @@ class SyscallsStateProvider(sp.StateProvider):
             current_syscall["count"] = 0
             current_syscall["fd"].fdtype = current_syscall["fdtype"]
             current_syscall["iorequest"].operation = sv.IORequest.OP_OPEN
-            self.track_rw_latency(name, ret, c,
+            self.track_rw_latency(info, ret, c,
                                   event.timestamp, event)
-        elif name in sv.SyscallConsts.READ_SYSCALLS or \
-                name in sv.SyscallConsts.WRITE_SYSCALLS:
-            self.track_read_write_return(name, ret, c)
-            self.track_rw_latency(name, ret, c, event.timestamp, event)
-        elif name in sv.SyscallConsts.SYNC_SYSCALLS:
+        elif info.read or info.write:
+            self.track_read_write_return(info, ret, c)
+            self.track_rw_latency(info, ret, c, event.timestamp, event)
+        elif info.sync:
             current_syscall["iorequest"].operation = sv.IORequest.OP_SYNC
-            self.track_rw_latency(name, ret, c, event.timestamp, event)
-            if name in ["sys_sync", "syscall_entry_sync"]:
-                t = self.tids[c.current_tid]
-                t.iorequests.append(current_syscall["iorequest"])
+            self.track_rw_latency(info, ret, c, event.timestamp, event)
         self.tids[c.current_tid].current_syscall = {}
         if self.tids[c.current_tid] in self.pending_syscalls:
             self.pending_syscalls.remove(self.tids[c.current_tid])
@@ -584,9 +580,15 @@ class SyscallsStateProvider(sp.StateProvider):
         if len(current_syscall.keys()) == 0:
             return
         current_syscall["wakeup_kswapd"] = 1
+        self._kswapd_procs.add(self.tids[c.current_tid])
 
     def _process_mm_page_free(self, event):
         """mm_page_free"""
+        # only the syscalls which woke up kswapd count the freed pages
+        if not self._kswapd_procs:
+            return
+        self._kswapd_procs = set(p for p in self._kswapd_procs
+                                 if "wakeup_kswapd" in p.current_syscall)
         for c in self.cpus.values():
             if c.current_tid <= 0:
                 continue
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+#
+# The MIT License (MIT)
+#
+# Copyright (C) 2015 - Julien Desfossez <jdesfosez@efficios.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+
+import unittest
+
+try:
+    from babeltrace import CTFScope
+except ImportError:
+    raise unittest.SkipTest('the babeltrace bindings are not installed')
+
+from linuxautomaton import sp
+
+
+class _Handle():
+    id = 0
+
+
+class _Event():
+    """Event of the stream class stream_id with the given contexts"""
+    handle = _Handle()
+
+    def __init__(self, name, stream_id, context, payload):
+        self.name = name
+        self._stream_id = stream_id
+        self._context = context
+        self._payload = payload
+
+    def keys(self):
+        return self._context + self._payload
+
+    def field_list_with_scope(self, scope):
+        if scope == CTFScope.STREAM_EVENT_CONTEXT:
+            return self._context
+        if scope == CTFScope.EVENT_FIELDS:
+            return self._payload
+        return []
+
+    def field_with_scope(self, field_name, scope):
+        if scope == CTFScope.TRACE_PACKET_HEADER and \
+                field_name == 'stream_id':
+            return self._stream_id
+        return None
+
+
+class FieldPlansTest(unittest.TestCase):
+    def test_plan_per_stream_class(self):
+        plans = sp.FieldPlans()
+        payload = ['prev_comm', 'prev_tid', 'next_comm', 'next_tid']
+        plain = _Event('sched_switch', 0, [], payload)
+        perf = _Event('sched_switch', 1, ['perf_cpu_cycles', 'pid'],
+                      payload)
+        self.assertEqual(plans.get(plain).perf, ())
+        self.assertFalse(plans.get(plain).ctx_pid)
+        self.assertEqual(plans.get(perf).perf, ('perf_cpu_cycles',))
+        self.assertTrue(plans.get(perf).ctx_pid)
+        self.assertIs(plans.get(plain), plans.get(plain))
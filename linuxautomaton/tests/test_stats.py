@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+#
+# The MIT License (MIT)
+#
+# Copyright (C) 2015 - Julien Desfossez <jdesfosez@efficios.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import math
+import unittest
+
+from linuxautomaton.stats import LatencyStats, histogram
+
+
+def _stats(values):
+    s = LatencyStats()
+    for v in values:
+        s.add(v)
+    return s
+
+
+class LatencyStatsTest(unittest.TestCase):
+    def test_empty(self):
+        s = LatencyStats()
+        self.assertEqual(s.count, 0)
+        self.assertIsNone(s.min)
+        self.assertIsNone(s.stdev())
+        self.assertIsNone(s.quantile(0.5))
+        self.assertEqual(list(s.values()), [])
+        self.assertIsNone(s.histogram(10))
+
+    def test_single_value(self):
+        s = _stats([42])
+        self.assertEqual((s.min, s.max, s.total), (42, 42, 42))
+        self.assertIsNone(s.stdev())
+        self.assertEqual(s.quantile(0), 42)
+        self.assertEqual(s.quantile(1), 42)
+        # no range to split
+        self.assertIsNone(s.histogram(10))
+
+    def test_mean_stdev(self):
+        values = [2, 4, 4, 4, 5, 5, 7, 9]
+        s = _stats(values)
+        mean = sum(values) / len(values)
+        var = sum((v - mean) ** 2 for v in values) / (len(values) - 1)
+        self.assertAlmostEqual(s.mean, mean)
+        self.assertAlmostEqual(s.stdev(), math.sqrt(var))
+
+    def test_quantiles(self):
+        s = _stats(range(1, 10001))
+        # the extremes are exact
+        self.assertEqual(s.quantile(0), 1)
+        self.assertEqual(s.quantile(1), 10000)
+        for q in (0.5, 0.9, 0.99):
+            expected = q * 10000
+            self.assertLessEqual(abs(s.quantile(q) - expected),
+                                 2 * LatencyStats.ACCURACY * expected)
+
+    def test_zero_and_negative(self):
+        s = _stats([0, -5, 10])
+        self.assertEqual(s.min, -5)
+        self.assertEqual(s.quantile(0), -5)
+        self.assertEqual(s.quantile(1), 10)
+        self.assertEqual(sum(n for v, n in s.values()), 3)
+
+    def test_merge(self):
+        a = _stats(range(0, 500))
+        b = _stats(range(500, 1000))
+        ref = _stats(range(1000))
+        a.merge(b)
+        self.assertEqual((a.count, a.total, a.min, a.max),
+                         (ref.count, ref.total, ref.min, ref.max))
+        self.assertAlmostEqual(a.mean, ref.mean)
+        self.assertAlmostEqual(a.stdev(), ref.stdev())
+        self.assertEqual(a.buckets, ref.buckets)
+
+    def test_merge_empty(self):
+        a = _stats([1, 2])
+        a.merge(LatencyStats())
+        self.assertEqual(a.count, 2)
+        b = LatencyStats()
+        b.merge(a)
+        self.assertEqual((b.count, b.min, b.max), (2, 1, 2))
+
+
+class HistogramTest(unittest.TestCase):
+    def test_linear(self):
+        h = histogram([(0, 1), (5, 2), (10, 3)], 0, 10, 2)
+        self.assertEqual(h, [(0, 1), (5.0, 5)])
+
+    def test_log(self):
+        h = histogram([(1, 1), (10, 2), (100, 3)], 1, 100, 2, log=True)
+        self.assertEqual([n for low, n in h], [1, 5])
+        self.assertAlmostEqual(h[1][0], 10)
+
+    def test_log_zero(self):
+        h = histogram([(0, 4), (1, 1), (100, 1)], 0, 100, 2, log=True)
+        self.assertEqual([n for low, n in h], [5, 1])
+
+    def test_no_range(self):
+        self.assertIsNone(histogram([(3, 1)], 3, 3, 4))
+        self.assertIsNone(histogram([(0, 1)], 0, 0, 4, log=True))
+
+    def test_counts_kept(self):
+        s = _stats([i * i for i in range(1000)])
+        for log in (False, True):
+            h = s.histogram(20, scale=1000, log=log)
+            self.assertEqual(len(h), 20)
+            self.assertEqual(sum(n for low, n in h), s.count)
+
+
+if __name__ == '__main__':
+    unittest.main()
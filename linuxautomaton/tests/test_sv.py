@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+#
+# The MIT License (MIT)
+#
+# Copyright (C) 2015 - Julien Desfossez <jdesfosez@efficios.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import unittest
+
+from linuxautomaton import sv
+
+
+def _rq(begin, name="read", size=None):
+    rq = sv.IORequest()
+    rq.iotype = sv.IORequest.IO_SYSCALL
+    rq.operation = sv.IORequest.OP_READ
+    rq.begin = begin
+    rq.end = begin + 10
+    rq.duration = 10
+    rq.size = size
+    rq.name = name
+    return rq
+
+
+def _proc(tid, pid):
+    p = sv.Process()
+    p.tid = tid
+    p.pid = pid
+    return p
+
+
+class IORequestStoreTest(unittest.TestCase):
+    def test_append_get(self):
+        store = sv.IORequestStore()
+        self.assertEqual(len(store), 0)
+        self.assertEqual(store.append(_rq(100, size=4096)), 0)
+        self.assertEqual(store.append(_rq(200, name="write")), 1)
+        self.assertEqual(len(store), 2)
+        rq = store.get(0)
+        self.assertEqual((rq.begin, rq.end, rq.size, rq.name),
+                         (100, 110, 4096, "read"))
+        # no size is stored as NO_SIZE and given back as None
+        self.assertEqual(store.size[1], sv.IORequestStore.NO_SIZE)
+        self.assertIsNone(store.get(1).size)
+        self.assertEqual(store.get(1).name, "write")
+
+    def test_clear(self):
+        store = sv.IORequestStore()
+        store.append(_rq(100))
+        store.clear()
+        self.assertEqual(len(store), 0)
+        self.assertEqual(store.names, [None])
+        self.assertEqual(store.append(_rq(300, name="sync")), 0)
+        self.assertEqual(store.get(0).name, "sync")
+
+    def test_extend(self):
+        a = sv.IORequestStore()
+        a.append(_rq(100, name="read"))
+        b = sv.IORequestStore()
+        b.append(_rq(200, name="write"))
+        b.append(_rq(300, name="read"))
+        offset = a.extend(b)
+        self.assertEqual(offset, 1)
+        self.assertEqual(len(a), 3)
+        # the rows of b are shifted by the offset, their names are
+        # mapped to the ids of a
+        for row in range(len(b)):
+            self.assertEqual(a.get(row + offset).begin, b.get(row).begin)
+            self.assertEqual(a.get(row + offset).name, b.get(row).name)
+        self.assertEqual(a.names.count("read"), 1)
+
+    def test_extend_empty(self):
+        a = sv.IORequestStore()
+        self.assertEqual(a.extend(sv.IORequestStore()), 0)
+        b = sv.IORequestStore()
+        b.append(_rq(100))
+        self.assertEqual(a.extend(b), 0)
+        self.assertEqual(a.get(0).begin, 100)
+
+
+class DirtyPageQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.t1 = _proc(10, 10)
+        self.t2 = _proc(11, 10)
+        self.other = _proc(20, 20)
+
+    def _page(self, proc, fd):
+        return (proc, "write", "file%d" % fd, fd)
+
+    def test_empty(self):
+        q = sv.DirtyPageQueue()
+        self.assertEqual(len(q), 0)
+        self.assertEqual(q.pop_all(), [])
+        self.assertEqual(q.pop_matching(3, 10, 10), [])
+
+    def test_popleft(self):
+        q = sv.DirtyPageQueue()
+        pages = [self._page(self.t1, fd) for fd in range(3)]
+        q.extend(pages)
+        self.assertEqual(q.popleft(), pages[0])
+        self.assertEqual(len(q), 2)
+        self.assertEqual(list(q), pages[1:])
+
+    def test_pop_matching(self):
+        q = sv.DirtyPageQueue()
+        p1 = self._page(self.t1, 3)
+        p2 = self._page(self.other, 3)
+        p3 = self._page(self.t2, 3)
+        p4 = self._page(self.t1, 4)
+        q.extend([p1, p2, p3, p4])
+        # the pages of the thread and of the other threads of its
+        # process, oldest first
+        self.assertEqual(q.pop_matching(3, 10, 10), [p1, p3])
+        self.assertEqual(len(q), 2)
+        self.assertEqual(list(q), [p2, p4])
+        self.assertEqual(q.pop_matching(3, 10, 10), [])
+
+    def test_popleft_after_pop_matching(self):
+        q = sv.DirtyPageQueue()
+        p1 = self._page(self.t1, 3)
+        p2 = self._page(self.other, 3)
+        q.extend([p1, p2])
+        q.pop_matching(3, 10, 10)
+        # the removed page is skipped
+        self.assertEqual(q.popleft(), p2)
+        self.assertEqual(len(q), 0)
+
+    def test_compact(self):
+        q = sv.DirtyPageQueue()
+        for i in range(5000):
+            q.append(self._page(self.t1, 3))
+            if i % 50 == 0:
+                q.append(self._page(self.other, 4))
+        self.assertEqual(len(q.pop_matching(3, 10, 10)), 5000)
+        # the removed entries don't stay in the queue
+        self.assertEqual(len(q), 100)
+        self.assertEqual(len(q._queue), 100)
+        self.assertTrue(all(page[3] == 4 for page in q))
+
+    def test_pop_all(self):
+        q = sv.DirtyPageQueue()
+        pages = [self._page(self.t1, 3), self._page(self.other, 4)]
+        q.extend(pages)
+        q.popleft()
+        self.assertEqual(q.pop_all(), pages[1:])
+        self.assertEqual(len(q), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -22,7 +22,19 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+from linuxautomaton import sp
+
 
 class Analysis:
+    # event name -> callback, the analyses only get the events they
+    # registered (see _register_cbs)
+    _cbs = {}
+
     def process_event(self, ev):
         raise NotImplementedError()
+
+    def _register_cbs(self, cbs):
+        self._cbs = cbs
+
+    def get_event_cbs(self, name):
+        return sp.get_event_cbs(self._cbs, name)
@@ -28,6 +28,7 @@ from .analysis import Analysis
 class SyscallsAnalysis(Analysis):
     def __init__(self, state):
         self._state = state
+        self._register_cbs({})
 
     def process_event(self, ev):
         pass
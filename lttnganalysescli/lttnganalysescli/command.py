@@ -23,21 +23,42 @@
 # SOFTWARE.
 
 import linuxautomaton.automaton
-from lttnganalysescli import progressbar
+from linuxautomaton import profiler
+from lttnganalysescli import progressbar, traceindex, eventcache
 from linuxautomaton import common
 from babeltrace import TraceCollection
 import argparse
+import multiprocessing
+import os
+import re
+import shutil
+import signal
 import sys
+import tempfile
+import time
+
+# next refresh boundary when --refresh is not used
+_NO_REFRESH = 2 ** 64
 
 
 class Command:
+    # the analysis needs the state built from the beginning of the
+    # trace, a time range can't be processed by seeking to its start
+    _NEEDS_HISTORY = True
+    # names of the state providers the analysis reads the state of
+    # (see linuxautomaton.automaton.PROVIDERS), None for all of them
+    _PROVIDERS = None
+    # seconds between two reads of a trace being recorded (--follow)
+    _FOLLOW_INTERVAL = 1
+
     def __init__(self, add_arguments_cb,
                  enable_proc_filter_args=False,
                  enable_max_min_args=False,
                  enable_max_min_size_arg=False,
                  enable_freq_arg=False,
                  enable_log_arg=False,
-                 enable_stats_arg=False):
+                 enable_stats_arg=False,
+                 enable_jobs_arg=False):
         self._add_arguments_cb = add_arguments_cb
         self._enable_proc_filter_args = enable_proc_filter_args
         self._enable_max_min_arg = enable_max_min_args
@@ -45,6 +66,17 @@ class Command:
         self._enable_freq_arg = enable_freq_arg
         self._enable_log_arg = enable_log_arg
         self._enable_stats_arg = enable_stats_arg
+        self._enable_jobs_arg = enable_jobs_arg
+        # timestamp of the first event of the whole trace at or after
+        # --begin, when only a subset of its streams is read
+        self._begin_ts = None
+        self._index = None
+        self._cache = None
+        # timestamp of the snapshot the automaton was restored from
+        self._resume_ts = None
+        # set on SIGINT to end a --follow run
+        self._follow_stop = False
+        self._profiler = None
         self._create_automaton()
 
     def _error(self, msg, exit_code=1):
@@ -64,62 +96,327 @@ class Command:
             self._gen_error("Failed to open " + self._arg_path, -1)
         self._handle = handle
         self._traces = traces
+        self._automaton.clear_field_plans()
         common.process_date_args(self)
+        # the trace changes under a --follow run, nothing to index
+        if not self._arg_no_index and not self._arg_follow:
+            self._index = traceindex.TraceIndex(self._arg_path)
+            self._index.open()
+            if self._arg_cache:
+                self._cache = eventcache.EventCache(self._index.events_dir)
+                self._cache.open()
+            # the per-CPU workers of --jobs replay their streams from
+            # the start, their states are merged into an empty one
+            if self._arg_begin and self._NEEDS_HISTORY and \
+                    not self._parallel():
+                self._restore_snapshot()
+
+    def _restore_snapshot(self):
+        """Restart the automaton from the latest snapshot before --begin
+        instead of replaying the trace from its first event"""
+        snap = self._index.load_snapshot(self._arg_begin,
+                                         self._automaton.providers)
+        if snap is None:
+            return
+        self._resume_ts, state = snap
+        self._create_automaton(state)
 
     def _close_trace(self):
         for h in self._handle.values():
             self._traces.remove_trace(h)
 
+    def _parallel(self):
+        return self._enable_jobs_arg and self._arg_jobs > 1
+
     def _run_analysis(self, reset_cb, refresh_cb, break_cb=None):
+        if self._parallel():
+            self._run_analysis_parallel()
+            return
         self.trace_start_ts = 0
         self.trace_end_ts = 0
-        self.current_sec = 0
         self.start_ns = 0
         self.end_ns = 0
         started = 0
-        progressbar.progressbar_setup(self)
+        # end of the current refresh window, set by the first event
+        # after --begin
+        self._next_refresh = None
+        next_refresh = _NO_REFRESH
+        self._register_analyses()
+        if self._arg_profile_providers:
+            self._profiler = profiler.Profiler()
+            self._automaton.set_profiler(self._profiler)
+        seek = self._arg_begin and not self._NEEDS_HISTORY
+        if seek:
+            first_ts = self._arg_begin
+        else:
+            first_ts = self._resume_ts
+        cache = self._cache
+        if cache is not None and cache.complete:
+            events = cache.events(first_ts)
+            cache = None
+        elif first_ts is not None:
+            end = self._arg_end or self._traces.timestamp_end
+            events = self._traces.events_timestamps(first_ts, end)
+        else:
+            events = self._traces.events
+        # fill the index counts along the way when it doesn't have them
+        index = self._index
+        if index is not None and (index.complete or first_ts is not None):
+            index = None
+        # same for the event cache, which must hold the whole trace
+        if cache is not None:
+            cache = None if first_ts is not None else cache.writer()
+        if self._arg_follow:
+            events = self._follow_events(events)
+            prev_sigint = signal.signal(signal.SIGINT, self._stop_follow)
+        self._event_total = None
+        if self._index is not None:
+            self._event_total = self._index.event_count(first_ts,
+                                                        self._arg_end)
+        # snapshots of the state, as long as no reset touched it
+        next_snapshot = None
+        if self._index is not None and self._NEEDS_HISTORY and \
+                self._arg_snapshot_interval and not self._arg_refresh:
+            interval = self._arg_snapshot_interval * common.NSEC_PER_SEC
+            next_snapshot = ((first_ts or self._traces.timestamp_begin) //
+                             interval + 1) * interval
+        next_progress = progressbar.progressbar_setup(self, first_ts)
+        nr_events = 0
+        # stopped at --end before the last event
+        truncated = False
         if not self._arg_begin:
             started = 1
-        for event in self._traces.events:
-            progressbar.progressbar_update(self)
-            if self._arg_begin and started == 0 and \
-                    event.timestamp >= self._arg_begin:
+            if self._refresh_period:
+                next_refresh = 0
+        get_event_cbs = self._automaton.get_event_cbs
+        for event in events:
+            nr_events += 1
+            if nr_events >= next_progress:
+                next_progress = progressbar.progressbar_update(
+                    self, nr_events, event.timestamp)
+            if index is not None:
+                index.add_event(event.name, event.timestamp)
+            if cache is not None:
+                cache.add(event)
+            # skip the events neither the analysis nor the automaton
+            # consume before any of their fields get decoded
+            if not get_event_cbs(event.name):
+                continue
+            ts = event.timestamp
+            if next_snapshot is not None and ts >= next_snapshot:
+                self._index.write_snapshot(self._automaton.state, ts,
+                                           self._automaton.providers)
+                next_snapshot = (ts // interval + 1) * interval
+            if self._arg_begin and started == 0 and ts >= self._arg_begin:
                 started = 1
-                self.trace_start_ts = event.timestamp
-                self.start_ns = event.timestamp
-                reset_cb(event.timestamp)
-            if self._arg_end and event.timestamp > self._arg_end:
+                next_snapshot = None
+                self.trace_start_ts = ts
+                self.start_ns = ts
+                if self._begin_ts is not None:
+                    reset_cb(self._begin_ts)
+                else:
+                    reset_cb(ts)
+                if self._refresh_period:
+                    next_refresh = 0
+            if self._arg_end and ts > self._arg_end:
                 if break_cb is not None:
                     # check if we really can break here
                     if break_cb():
+                        index = None
+                        truncated = True
                         break
                 else:
+                    index = None
+                    truncated = True
                     break
             if self.start_ns == 0:
-                self.start_ns = event.timestamp
+                self.start_ns = ts
             if self.trace_start_ts == 0:
-                self.trace_start_ts = event.timestamp
-            self.end_ns = event.timestamp
-            self._check_refresh(event, refresh_cb)
-            self.trace_end_ts = event.timestamp
-            # feed analysis
-            self._analysis.process_event(event)
-            # feed automaton
+                self.trace_start_ts = ts
+            self.end_ns = ts
+            if ts >= next_refresh:
+                next_refresh = self._check_refresh(ts, refresh_cb)
+            self.trace_end_ts = ts
+            # feed the analysis and the automaton
             self._automaton.process_event(event)
+        if self._arg_follow:
+            signal.signal(signal.SIGINT, prev_sigint)
         progressbar.progressbar_finish(self)
+        if self._profiler is not None:
+            self._write_profile()
+        if index is not None:
+            index.complete = True
+            index.save()
+        if cache is not None:
+            # the cache must hold the whole trace
+            if truncated:
+                cache.discard()
+            else:
+                cache.save()
 
-    def _check_refresh(self, event, refresh_cb):
-        """Check if we need to output something"""
-        if self._arg_refresh == 0:
+    def _write_profile(self):
+        if self._arg_profile_providers == '-':
+            self._profiler.print_summary(sys.stderr)
             return
-        event_sec = event.timestamp / common.NSEC_PER_SEC
-        if self.current_sec == 0:
-            self.current_sec = event_sec
-        elif self.current_sec != event_sec and \
-                (self.current_sec + self._arg_refresh) <= event_sec:
-            refresh_cb(self.start_ns, event.timestamp)
-            self.current_sec = event_sec
-            self.start_ns = event.timestamp
+        with open(self._arg_profile_providers, 'w') as f:
+            self._profiler.dump_json(f)
+
+    def _follow_events(self, events):
+        """Events of a trace being recorded: once the ones on disk are
+        consumed, reopen the trace every _FOLLOW_INTERVAL seconds and
+        continue after the last event read, until SIGINT"""
+        last_ts = None
+        # events read at last_ts, seen again when the trace is reopened
+        count = 0
+        skip = 0
+        while True:
+            for event in events:
+                if self._follow_stop:
+                    return
+                ts = event.timestamp
+                if skip:
+                    skip -= 1
+                    if ts == last_ts:
+                        continue
+                    skip = 0
+                if ts != last_ts:
+                    last_ts = ts
+                    count = 0
+                count += 1
+                yield event
+            time.sleep(self._FOLLOW_INTERVAL)
+            if self._follow_stop:
+                return
+            self._close_trace()
+            self._traces = TraceCollection()
+            self._handle = self._traces.add_traces_recursive(self._arg_path,
+                                                             "ctf")
+            self._automaton.clear_field_plans()
+            if last_ts is None:
+                events = self._traces.events
+            else:
+                events = self._traces.events_timestamps(
+                    last_ts, self._traces.timestamp_end)
+                skip = count
+
+    def _stop_follow(self, signum, frame):
+        self._follow_stop = True
+
+    def _register_analyses(self):
+        self._automaton.add_analysis(self._analysis)
+
+    def _split_streams_per_cpu(self):
+        """Mirror the trace in a temporary directory, once per CPU, with
+        only the streams recorded on that CPU (<channel>_<cpu> files)"""
+        tmpdir = tempfile.mkdtemp(prefix='lttng-analyses-')
+        cpus = set()
+        for root, dirs, files in os.walk(self._arg_path):
+            if 'metadata' not in files:
+                continue
+            rel = os.path.relpath(root, self._arg_path)
+            for f in files:
+                m = re.match(r'^.+_(\d+)$', f)
+                if m is None:
+                    continue
+                cpu = int(m.group(1))
+                path = os.path.join(tmpdir, str(cpu), rel)
+                if not os.path.exists(path):
+                    os.makedirs(os.path.join(path, 'index'))
+                    os.symlink(os.path.join(root, 'metadata'),
+                               os.path.join(path, 'metadata'))
+                os.symlink(os.path.join(root, f), os.path.join(path, f))
+                idx = os.path.join(root, 'index', f + '.idx')
+                if os.path.exists(idx):
+                    os.symlink(idx, os.path.join(path, 'index', f + '.idx'))
+                cpus.add(cpu)
+        return tmpdir, [os.path.join(tmpdir, str(cpu))
+                        for cpu in sorted(cpus)]
+
+    def _find_begin_ts(self):
+        """Timestamp of the first consumed event at or after --begin"""
+        self._register_analyses()
+        get_event_cbs = self._automaton.get_event_cbs
+        for event in self._traces.events_timestamps(
+                self._arg_begin, self._traces.timestamp_end):
+            if get_event_cbs(event.name):
+                return event.timestamp
+        return None
+
+    def _run_analysis_parallel(self):
+        """Run one automaton per CPU over the streams of that CPU only
+        and merge the resulting states in CPU order.
+
+        Only valid for the analyses that depend on per-CPU state alone
+        (current task, IRQ nesting, page allocations, syscall counts)"""
+        self._begin_ts = None
+        if self._arg_begin:
+            self._begin_ts = self._find_begin_ts()
+        tmpdir, paths = self._split_streams_per_cpu()
+        overrides = {
+            '_arg_begin': self._arg_begin,
+            '_arg_end': self._arg_end,
+            '_begin_ts': self._begin_ts,
+            '_arg_jobs': 1,
+            '_arg_no_progress': True,
+        }
+        # the workers only parse the arguments, the outputs selected by
+        # the executable (e.g. lttng-irqlog) decide what they keep
+        for key in ['_arg_stats', '_arg_log', '_arg_freq', '_arg_usage']:
+            if hasattr(self, key):
+                overrides[key] = getattr(self, key)
+        jobs = [(self.__class__, self._args, path, overrides)
+                for path in paths]
+        try:
+            with multiprocessing.Pool(self._arg_jobs) as pool:
+                results = pool.map(_run_streams, jobs)
+        finally:
+            shutil.rmtree(tmpdir)
+
+        self.start_ns = 0
+        self.trace_start_ts = 0
+        self.end_ns = 0
+        self.trace_end_ts = 0
+        for state, start_ns, end_ns in results:
+            self._automaton.state.merge(state)
+            if start_ns != 0 and (self.start_ns == 0 or
+                                  start_ns < self.start_ns):
+                self.start_ns = start_ns
+            self.end_ns = max(self.end_ns, end_ns)
+        if self._begin_ts is not None:
+            self.start_ns = self._begin_ts
+        self.trace_start_ts = self.start_ns
+        self.trace_end_ts = self.end_ns
+
+    def _reset_total(self, start_ts):
+        """Start a new refresh window at start_ts"""
+        self._reset_counts()
+        self._start_window(start_ts)
+
+    def _reset_counts(self):
+        """Clear the counters of the state the command prints"""
+        pass
+
+    def _start_window(self, start_ts):
+        """Seed the state for a window starting at start_ts, called once
+        the counters are cleared"""
+        pass
+
+    def _check_refresh(self, ts, refresh_cb):
+        """Output the refresh windows that ended at or before ts, empty
+        ones included, and return the end of the current window"""
+        if self._next_refresh is None:
+            self._next_refresh = ts + self._refresh_period
+            return self._next_refresh
+        while ts >= self._next_refresh:
+            end = self._next_refresh
+            self.end_ns = end
+            refresh_cb(self.start_ns, end)
+            self.start_ns = end
+            self._next_refresh = end + self._refresh_period
+            # only the current window is kept
+            self._automaton.evict_history()
+        self.end_ns = ts
+        return self._next_refresh
 
     def _validate_transform_common_args(self, args):
         self._arg_path = args.path
@@ -138,7 +435,26 @@ class Command:
         if args.gmt:
             self._arg_gmt = args.gmt
         self._arg_refresh = args.refresh
+        if self._arg_refresh < 0:
+            self._cmdline_error('--refresh must be positive')
+        self._refresh_period = int(self._arg_refresh * common.NSEC_PER_SEC)
+        if self._arg_refresh and not self._refresh_period:
+            self._cmdline_error('--refresh must be at least 1 ns')
         self._arg_no_progress = args.no_progress
+        self._arg_no_index = args.no_index
+        self._arg_snapshot_interval = args.snapshot_interval
+        self._arg_cache = args.cache
+        if self._arg_cache and self._arg_no_index:
+            self._cmdline_error('--cache cannot be used with --no-index')
+        self._arg_follow = args.follow
+        if self._arg_follow:
+            if not self._arg_refresh:
+                self._cmdline_error('--follow needs --refresh')
+            if self._arg_cache:
+                self._cmdline_error('--cache cannot be used with --follow')
+            # the size of the trace is unknown
+            self._arg_no_progress = True
+        self._arg_profile_providers = args.profile_providers
 
         if self._enable_proc_filter_args:
             self._arg_proc_list = None
@@ -171,6 +487,7 @@ class Command:
         if self._enable_freq_arg:
             self._arg_freq = args.freq
             self._arg_freq_resolution = args.freq_resolution
+            self._arg_freq_log = args.freq_log
 
         if self._enable_log_arg:
             self._arg_log = args.log
@@ -178,17 +495,55 @@ class Command:
         if self._enable_stats_arg:
             self._arg_stats = args.stats
 
+        if self._enable_jobs_arg:
+            self._arg_jobs = args.jobs
+            if self._arg_jobs < 1:
+                self._cmdline_error('--jobs must be at least 1')
+            if self._arg_jobs > 1 and self._arg_refresh:
+                self._cmdline_error('--refresh cannot be used with --jobs')
+            if self._arg_jobs > 1 and self._arg_cache:
+                self._cmdline_error('--cache cannot be used with --jobs')
+            if self._arg_jobs > 1 and self._arg_follow:
+                self._cmdline_error('--follow cannot be used with --jobs')
+            if self._arg_jobs > 1 and self._arg_profile_providers:
+                self._cmdline_error('--profile-providers cannot be used '
+                                    'with --jobs')
+
     def _parse_args(self):
         ap = argparse.ArgumentParser(description=self._DESC)
 
         # common arguments
         ap.add_argument('path', metavar="<path/to/trace>", help='trace path')
-        ap.add_argument('-r', '--refresh', type=int,
-                        help='Refresh period in seconds', default=0)
+        ap.add_argument('-r', '--refresh', type=float,
+                        help='Refresh period in seconds (fractions '
+                             'allowed)', default=0)
         ap.add_argument('--limit', type=int, default=10,
                         help='Limit to top X (default = 10)')
         ap.add_argument('--no-progress', action="store_true",
                         help='Don\'t display the progress bar')
+        ap.add_argument('--no-index', action="store_true",
+                        help='Don\'t use or build the trace index '
+                             'and state snapshots')
+        ap.add_argument('--snapshot-interval', type=int, default=0,
+                        help='Save the state every N seconds of trace '
+                             'time so that later runs with --begin '
+                             'resume from there (default 0, disabled)')
+        ap.add_argument('--cache', action="store_true",
+                        help='Save the decoded events on the first run '
+                             'and read them back instead of the trace '
+                             'on the next ones (the first run decodes '
+                             'all the fields of every event, even the '
+                             'ones no analysis uses)')
+        ap.add_argument('--follow', action="store_true",
+                        help='Keep reading the trace as it is being '
+                             'recorded, until interrupted (needs '
+                             '--refresh)')
+        ap.add_argument('--profile-providers', nargs='?', const='-',
+                        metavar='FILE',
+                        help='Print the calls, time and memory blocks '
+                             'allocated by each state provider callback '
+                             'on stderr at the end, or save them as JSON '
+                             'in FILE')
         ap.add_argument('--gmt', action="store_true",
                         help='Manipulate timestamps based on GMT instead '
                              'of local time')
@@ -228,6 +583,8 @@ class Command:
             ap.add_argument('--freq-resolution', type=int, default=20,
                             help='Frequency distribution resolution '
                                  '(default 20)')
+            ap.add_argument('--freq-log', action="store_true",
+                            help='Log-scale frequency distribution buckets')
 
         if self._enable_log_arg:
             ap.add_argument('--log', action="store_true",
@@ -238,6 +595,11 @@ class Command:
             ap.add_argument('--stats', action="store_true",
                             help='Display the statistics')
 
+        if self._enable_jobs_arg:
+            ap.add_argument('-j', '--jobs', type=int, default=1,
+                            help='Number of processes reading the per-CPU '
+                                 'streams in parallel (default 1)')
+
         # specific arguments
         self._add_arguments_cb(ap)
 
@@ -253,5 +615,25 @@ class Command:
         # save all arguments
         self._args = args
 
-    def _create_automaton(self):
-        self._automaton = linuxautomaton.automaton.Automaton()
+    def _create_automaton(self, state=None):
+        self._automaton = linuxautomaton.automaton.Automaton(
+            state, self._PROVIDERS)
+
+
+def _run_streams(job):
+    """Worker of Command._run_analysis_parallel: run the command over
+    the per-CPU trace directory path and return its state"""
+    cls, args, path, overrides = job
+    cmd = cls()
+    cmd._args = args
+    cmd._validate_transform_common_args(args)
+    cmd._validate_transform_args()
+    for key, value in overrides.items():
+        setattr(cmd, key, value)
+    cmd._traces = TraceCollection()
+    cmd._handle = cmd._traces.add_traces_recursive(path, "ctf")
+    cmd._create_analysis()
+    cmd._run_analysis(cmd._reset_total, cmd._refresh)
+    cmd._close_trace()
+
+    return cmd._automaton.state, cmd.start_ns, cmd.end_ns
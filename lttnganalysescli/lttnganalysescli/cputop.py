@@ -32,9 +32,12 @@ import operator
 class Cputop(Command):
     _VERSION = '0.1.0'
     _DESC = """The cputop command."""
+    _PROVIDERS = ['sched', 'statedump']
 
     def __init__(self):
-        super().__init__(self._add_arguments, enable_proc_filter_args=True)
+        super().__init__(self._add_arguments,
+                         enable_proc_filter_args=True,
+                         enable_jobs_arg=True)
 
     def _validate_transform_args(self):
         pass
@@ -73,15 +76,10 @@ class Cputop(Command):
                 self.state.tids[current_cpu.current_tid].cpu_ns += \
                     self.end_ns - current_cpu.start_task_ns
 
-    def _reset_total(self, start_ts):
+    def _reset_counts(self):
         self.state = self._automaton.state
         for cpu in self.state.cpus.keys():
-            current_cpu = self.state.cpus[cpu]
-            current_cpu.cpu_ns = 0
-            if current_cpu.start_task_ns != 0:
-                current_cpu.start_task_ns = start_ts
-            if current_cpu.current_tid >= 0:
-                self.state.tids[current_cpu.current_tid].last_sched = start_ts
+            self.state.cpus[cpu].cpu_ns = 0
         for tid in self.state.tids.keys():
             self.state.tids[tid].cpu_ns = 0
             self.state.tids[tid].migrate_count = 0
@@ -90,13 +88,21 @@ class Cputop(Command):
             for syscall in self.state.tids[tid].syscalls.keys():
                 self.state.tids[tid].syscalls[syscall].count = 0
 
+    def _start_window(self, start_ts):
+        # the running tasks are accounted from the start of the window
+        for cpu in self.state.cpus.keys():
+            current_cpu = self.state.cpus[cpu]
+            if current_cpu.start_task_ns != 0:
+                current_cpu.start_task_ns = start_ts
+            if current_cpu.current_tid >= 0:
+                self.state.tids[current_cpu.current_tid].last_sched = start_ts
+
     def _refresh(self, begin, end):
         self._compute_stats()
         self._print_results(begin, end, final=0)
         self._reset_total(end)
 
     def _print_results(self, begin_ns, end_ns, final=0):
-#        print('event count: {}'.format(self._analysis.event_count))
         count = 0
         limit = self._arg_limit
         total_ns = end_ns - begin_ns
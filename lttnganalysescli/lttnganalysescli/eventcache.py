@@ -0,0 +1,430 @@
+#!/usr/bin/env python3
+#
+# The MIT License (MIT)
+#
+# Copyright (C) 2015 - Julien Desfossez <jdesfosez@efficios.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import array
+import bisect
+import json
+import mmap
+import os
+import pickle
+import shutil
+import sys
+from babeltrace import CTFScope
+
+CACHE_VERSION = 2
+# events of a class buffered before their columns are written
+CHUNK_ROWS = 4096
+
+_SCOPES = [CTFScope.TRACE_PACKET_HEADER, CTFScope.STREAM_PACKET_CONTEXT,
+           CTFScope.STREAM_EVENT_HEADER, CTFScope.STREAM_EVENT_CONTEXT,
+           CTFScope.EVENT_CONTEXT, CTFScope.EVENT_FIELDS]
+
+# column kinds, the array typecode of their file except for _OBJ
+_INT = 'q'
+_UINT = 'Q'
+_FLOAT = 'd'
+# index in the string table
+_STR = 'I'
+# anything else (sequences, mixed types), pickled list
+_OBJ = 'o'
+
+
+def _column_file(path, cls_id, field_id, kind=None):
+    filename = os.path.join(path, '%d.%d' % (cls_id, field_id))
+    if kind is None:
+        return filename
+    return '%s.%s' % (filename, kind)
+
+
+def _map(filename, typecode):
+    with open(filename, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return memoryview(b'').cast(typecode)
+        m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return memoryview(m).cast(typecode)
+
+
+class _ColumnWriter():
+    """Values of one column, appended to its file by chunks"""
+    def __init__(self, filename, kind):
+        # without the kind suffix, which changes with the kind
+        self._filename = filename
+        self.kind = kind
+        self.values = [] if kind == _OBJ else array.array(kind)
+        self._written = 0
+
+    def _path(self):
+        return '%s.%s' % (self._filename, self.kind)
+
+    def flush(self):
+        # the file is created even for an empty column
+        if not self.values and self._written:
+            return
+        with open(self._path(), 'ab') as f:
+            if self.kind == _OBJ:
+                # one pickled list per chunk
+                pickle.dump(self.values, f,
+                            protocol=pickle.HIGHEST_PROTOCOL)
+            else:
+                self.values.tofile(f)
+        self._written += len(self.values)
+        del self.values[:]
+
+    def _read_back(self):
+        """All the values of the column, with the ones already in its
+        file, which is removed"""
+        values = array.array(self.kind)
+        if self._written:
+            with open(self._path(), 'rb') as f:
+                values.fromfile(f, self._written)
+            os.remove(self._path())
+            self._written = 0
+        values += self.values
+        return values
+
+    def convert(self, kind, strings=None):
+        """Rewrite the column with another kind, for the rare fields
+        whose values don't fit the kind of the first one"""
+        values = self._read_back()
+        if kind == _UINT:
+            values = array.array(_UINT, values)
+        elif self.kind == _STR:
+            names = list(strings)
+            values = [names[idx] for idx in values]
+        else:
+            values = list(values)
+        self.kind = kind
+        self.values = values
+
+    def min(self):
+        """Smallest value of an int column, None if it is empty"""
+        values = self._read_back()
+        self.values = values
+        return min(values) if values else None
+
+
+class _ClassWriter():
+    """Columns of the events of one event class"""
+    def __init__(self, event, keys, path, cls_id):
+        self.name = event.name
+        self.handle = event.handle.id
+        self.scopes = [[scope, event.field_list_with_scope(scope)]
+                       for scope in _SCOPES]
+        self.keys = keys
+        # a field can be in several scopes, event[key] returns the
+        # first one so a single column is enough
+        self.fields = list(dict.fromkeys(keys))
+        self._path = path
+        self._cls_id = cls_id
+        self.columns = [None] * len(self.fields)
+        self.rows = 0
+
+    def add(self, event, strings):
+        for i, key in enumerate(self.fields):
+            self._append(i, event[key], strings)
+        self.rows += 1
+        if self.rows % CHUNK_ROWS == 0:
+            self.flush()
+
+    def _append(self, i, value, strings):
+        col = self.columns[i]
+        if col is None:
+            if type(value) is int:
+                kind = _INT
+            elif type(value) is float:
+                kind = _FLOAT
+            elif type(value) is str:
+                kind = _STR
+            else:
+                kind = _OBJ
+            col = _ColumnWriter(_column_file(self._path, self._cls_id, i),
+                                kind)
+            self.columns[i] = col
+        kind = col.kind
+        if kind == _OBJ:
+            col.values.append(value)
+        elif kind == _STR:
+            if type(value) is not str:
+                col.convert(_OBJ, strings)
+                col.values.append(value)
+                return
+            idx = strings.get(value)
+            if idx is None:
+                idx = len(strings)
+                strings[value] = idx
+            col.values.append(idx)
+        elif kind == _FLOAT:
+            if type(value) is not float:
+                col.convert(_OBJ)
+                col.values.append(value)
+                return
+            col.values.append(value)
+        else:
+            if type(value) is not int:
+                col.convert(_OBJ)
+                col.values.append(value)
+                return
+            try:
+                col.values.append(value)
+            except OverflowError:
+                # 64-bit unsigned values (addresses, counters)
+                if kind == _INT and 0 <= value < 2 ** 64 and \
+                        (col.min() or 0) >= 0:
+                    col.convert(_UINT)
+                else:
+                    col.convert(_OBJ)
+                col.values.append(value)
+
+    def flush(self):
+        for col in self.columns:
+            col.flush()
+
+    def manifest(self):
+        return {
+            'name': self.name,
+            'handle': self.handle,
+            'scopes': self.scopes,
+            'keys': self.keys,
+            'fields': self.fields,
+            'kinds': [col.kind for col in self.columns],
+            'rows': self.rows,
+        }
+
+
+class EventCacheWriter():
+    """Records the decoded events of a run over the whole trace.
+
+    The columns are appended to their files every CHUNK_ROWS events of
+    their class, in a temporary directory renamed by save()."""
+    def __init__(self, path):
+        self._path = path
+        self._tmp = path + '.tmp'
+        # (trace handle id, event name, field names) -> class id
+        self._class_ids = {}
+        self._classes = []
+        # string -> index in the string table
+        self._strings = {}
+        # global order of the events
+        self._ts = _ColumnWriter(os.path.join(self._tmp, 'ts'), 'q')
+        self._cls = _ColumnWriter(os.path.join(self._tmp, 'cls'), 'H')
+        self._row = _ColumnWriter(os.path.join(self._tmp, 'row'), 'I')
+        self._count = 0
+        # the cache is only an optimization, never fail because of it,
+        # it is not saved after a write error
+        self._failed = False
+        try:
+            shutil.rmtree(self._tmp, ignore_errors=True)
+            os.makedirs(self._tmp)
+        except OSError:
+            self._failed = True
+
+    def add(self, event):
+        if self._failed:
+            return
+        keys = event.keys()
+        key = (event.handle.id, event.name, tuple(keys))
+        cls_id = self._class_ids.get(key)
+        if cls_id is None:
+            cls_id = len(self._classes)
+            self._class_ids[key] = cls_id
+            self._classes.append(_ClassWriter(event, keys, self._tmp,
+                                              cls_id))
+        cls = self._classes[cls_id]
+        self._ts.values.append(event.timestamp)
+        self._cls.values.append(cls_id)
+        self._row.values.append(cls.rows)
+        self._count += 1
+        try:
+            cls.add(event, self._strings)
+            if self._count % CHUNK_ROWS == 0:
+                for col in (self._ts, self._cls, self._row):
+                    col.flush()
+        except OSError:
+            self.discard()
+
+    def discard(self):
+        """Stop recording and remove what was written"""
+        self._failed = True
+        shutil.rmtree(self._tmp, ignore_errors=True)
+
+    def save(self):
+        if self._failed:
+            return
+        manifest = {
+            'version': CACHE_VERSION,
+            'byteorder': sys.byteorder,
+            'count': self._count,
+            'classes': [cls.manifest() for cls in self._classes],
+        }
+        try:
+            for col in (self._ts, self._cls, self._row):
+                col.flush()
+            for cls in self._classes:
+                cls.flush()
+            with open(os.path.join(self._tmp, 'strings.json'), 'w') as f:
+                json.dump(list(self._strings), f)
+            # written last, its presence marks a complete cache
+            with open(os.path.join(self._tmp, 'manifest.json'), 'w') as f:
+                json.dump(manifest, f)
+            shutil.rmtree(self._path, ignore_errors=True)
+            os.rename(self._tmp, self._path)
+        except OSError:
+            self.discard()
+
+
+class _Handle():
+    __slots__ = ['id']
+
+
+class _StrColumn():
+    __slots__ = ['_idx', '_strings']
+
+    def __init__(self, idx, strings):
+        self._idx = idx
+        self._strings = strings
+
+    def __getitem__(self, row):
+        return self._strings[self._idx[row]]
+
+
+class _EventClass():
+    __slots__ = ['name', 'handle', 'scopes', 'keys', 'columns']
+
+
+class CachedEvent():
+    """Event read back from the cache, with the subset of the
+    babeltrace Event interface used by the providers and analyses"""
+    __slots__ = ['name', 'timestamp', 'handle', '_cls', '_row']
+
+    def __getitem__(self, key):
+        return self._cls.columns[key][self._row]
+
+    def keys(self):
+        return list(self._cls.keys)
+
+    def field_list_with_scope(self, scope):
+        return list(self._cls.scopes.get(scope, []))
+
+    def field_with_scope(self, field_name, scope):
+        # a single column per field name, see _ClassWriter
+        if field_name not in self._cls.scopes.get(scope, ()):
+            return None
+        return self[field_name]
+
+
+def _load_objects(filename):
+    """Concatenate the pickled chunks of an _OBJ column"""
+    col = []
+    with open(filename, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        while f.tell() < size:
+            col += pickle.load(f)
+    return col
+
+
+class EventCache():
+    """Pre-decoded events of a trace, one directory per trace in the
+    user cache directory (see TraceIndex.events_dir).
+
+    Each event class (event name, trace and set of fields) has one
+    memory-mapped column per field, strings are interned in a table
+    shared by all the classes. Three global columns (timestamp, class
+    and row in the class) keep the order of the events."""
+    def __init__(self, path):
+        self._path = path
+        self.complete = False
+        self._classes = []
+        self._ts = None
+        self._cls = None
+        self._row = None
+
+    def open(self):
+        """Map the cache if a previous run wrote it, returns True on
+        success"""
+        try:
+            with open(os.path.join(self._path, 'manifest.json')) as f:
+                manifest = json.load(f)
+            if manifest.get('version') != CACHE_VERSION or \
+                    manifest.get('byteorder') != sys.byteorder:
+                return False
+            with open(os.path.join(self._path, 'strings.json')) as f:
+                strings = json.load(f)
+            self._ts = _map(os.path.join(self._path, 'ts.q'), 'q')
+            self._cls = _map(os.path.join(self._path, 'cls.H'), 'H')
+            self._row = _map(os.path.join(self._path, 'row.I'), 'I')
+            self._classes = []
+            for cls_id, desc in enumerate(manifest['classes']):
+                self._classes.append(self._load_class(cls_id, desc,
+                                                      strings))
+        except (OSError, ValueError, KeyError, EOFError,
+                pickle.UnpicklingError):
+            self._classes = []
+            return False
+        if len(self._ts) != manifest['count']:
+            return False
+        self.complete = True
+        return True
+
+    def _load_class(self, cls_id, desc, strings):
+        cls = _EventClass()
+        cls.name = desc['name']
+        cls.handle = _Handle()
+        cls.handle.id = desc['handle']
+        cls.scopes = {scope: fields for scope, fields in desc['scopes']}
+        cls.keys = desc['keys']
+        cls.columns = {}
+        for i, (field, kind) in enumerate(zip(desc['fields'],
+                                              desc['kinds'])):
+            filename = _column_file(self._path, cls_id, i, kind)
+            if kind == _OBJ:
+                col = _load_objects(filename)
+            elif kind == _STR:
+                col = _StrColumn(_map(filename, kind), strings)
+            else:
+                col = _map(filename, kind)
+            cls.columns[field] = col
+        return cls
+
+    def writer(self):
+        return EventCacheWriter(self._path)
+
+    def events(self, begin=None):
+        """Events from begin (ns) in the order they were read"""
+        ts = self._ts
+        cls = self._cls
+        row = self._row
+        classes = self._classes
+        first = 0
+        if begin is not None:
+            first = bisect.bisect_left(ts, begin)
+        for i in range(first, len(ts)):
+            c = classes[cls[i]]
+            event = CachedEvent()
+            event.name = c.name
+            event.timestamp = ts[i]
+            event.handle = c.handle
+            event._cls = c
+            event._row = row[i]
+            yield event
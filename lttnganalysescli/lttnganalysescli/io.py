@@ -27,12 +27,15 @@ import lttnganalyses.syscalls
 from linuxautomaton import common, sv
 from ascii_graph import Pyasciigraph
 import operator
-import statistics
 
 
 class IoAnalysis(Command):
     _VERSION = '0.1.0'
     _DESC = """The I/O command."""
+    # everything but the interrupts
+    _PROVIDERS = ['syscalls', 'mem', 'block', 'net', 'statedump']
+    _STATS_FMT = "{:<14} {:>14} {:>14} {:>14} {:>14} {:>14} {:>11} {:>11} " \
+        "{:>11}"
 
     def __init__(self):
         super().__init__(self._add_arguments,
@@ -47,6 +50,7 @@ class IoAnalysis(Command):
         self._arg_stats = self._args.latencystats
         self._arg_freq = self._args.latencyfreq
         self._arg_freq_resolution = self._args.freq_resolution
+        self._arg_freq_log = self._args.freq_log
 
     def _default_args(self, stats, log, freq, usage):
         if stats:
@@ -406,65 +410,23 @@ class IoAnalysis(Command):
         self.iotop_output_net_sent_bytes()
 #        self.output_latencies()
 
-    def iolatency_freq_histogram(self, _min, _max, res, rq_list, title):
-        step = (_max - _min) / res
-        if step == 0:
+    def iolatency_freq_histogram(self, res, stats, title):
+        buckets = stats.histogram(res, scale=1000, log=self._arg_freq_log)
+        if buckets is None:
             return
-        buckets = []
-        values = []
         graph = Pyasciigraph()
-        for i in range(res):
-            buckets.append(i * step)
-            values.append(0)
-        for i in rq_list:
-            v = i / 1000
-            b = min(int((v-_min)/step), res - 1)
-            values[b] += 1
-        g = []
-        i = 0
-        for v in values:
-            g.append(("%0.03f" % (i * step + _min), v))
-            i += 1
+        g = [("%0.03f" % low, n) for low, n in buckets]
         for line in graph.graph(title, g, info_before=True):
             print(line)
         print("")
 
-    def compute_disk_stats(self, dev):
-        _max = 0
-        _min = -1
-        total = 0
-        values = []
-        count = len(dev.rq_list)
-        if count == 0:
-            return
-        for rq in dev.rq_list:
-            if rq.duration > _max:
-                _max = rq.duration
-            if _min == -1 or rq.duration < _min:
-                _min = rq.duration
-            total += rq.duration
-            values.append(rq.duration)
-        if count > 2:
-            stdev = statistics.stdev(values) / 1000
-        else:
-            stdev = "?"
-        dev.min = _min / 1000
-        dev.max = _max / 1000
-        dev.total = total / 1000
-        dev.count = count
-        dev.rq_values = values
-        dev.stdev = stdev
-
     # iolatency functions
     def iolatency_output_disk(self):
         for dev in self.state.disks.keys():
             d = self.state.disks[dev]
-            if d.max is None:
-                self.compute_disk_stats(d)
-            if d.count is not None:
-                self.iolatency_freq_histogram(d.min, d.max,
-                                              self._arg_freq_resolution,
-                                              d.rq_values,
+            if d.latency.count > 0:
+                self.iolatency_freq_histogram(self._arg_freq_resolution,
+                                              d.latency,
                                               "Frequency distribution for "
                                               "disk %s (usec)" %
                                               (d.prettyname))
@@ -482,74 +444,63 @@ class IoAnalysis(Command):
 #                                    unit=" ms"):
 #                print(line)
 
-    def iostats_minmax(self, duration, current_min, current_max):
-        _min = current_min
-        _max = current_max
-        if current_min is None or duration < current_min:
-            _min = duration
-        if duration > current_max:
-            _max = duration
-        return (_min, _max)
-
-    def iostats_syscalls_line(self, fmt, name, count, _min, _max, total, rq):
-        if count < 2:
+    def iostats_syscalls_line(self, fmt, name, stats):
+        if stats.count < 2:
             stdev = "?"
         else:
-            stdev = "%0.03f" % (statistics.stdev(rq) / 1000)
-        if count < 1:
-            avg = "0.000"
+            stdev = "%0.03f" % (stats.stdev() / 1000)
+        if stats.count < 1:
+            _min = avg = _max = "0.000"
+            quantiles = ["?"] * 3
         else:
-            avg = "%0.03f" % (total / (count * 1000))
-        if _min is None:
-            _min = 0
-        _min = "%0.03f" % (_min / 1000)
-        _max = "%0.03f" % (_max / 1000)
-        print(fmt.format(name, count, _min, avg, _max, stdev))
+            _min = "%0.03f" % (stats.min / 1000)
+            avg = "%0.03f" % (stats.total / (stats.count * 1000))
+            _max = "%0.03f" % (stats.max / 1000)
+            quantiles = ["%0.03f" % (stats.quantile(q) / 1000)
+                         for q in (0.5, 0.99, 0.999)]
+        print(fmt.format(name, stats.count, _min, avg, _max, stdev,
+                         *quantiles))
 
     def account_syscall_iorequests(self, s, iorequests):
-        for rq in iorequests:
+        store = self.state.iorequests
+        keep_rows = s.all_read is not None
+        for row in iorequests:
             # filter out if completely out of range but accept the
             # union to show the real begin/end time
-            if self._arg_begin and self._arg_end and rq.end and \
-                    rq.begin > self._arg_end:
+            if self._arg_begin and self._arg_end and store.end[row] and \
+                    store.begin[row] > self._arg_end:
                 continue
-            if rq.iotype != sv.IORequest.IO_SYSCALL:
+            if store.iotype[row] != sv.IORequest.IO_SYSCALL:
                 continue
-            if not self.filter_size(rq.size):
+            size = store.size[row]
+            if size == sv.IORequestStore.NO_SIZE:
+                size = None
+            if not self.filter_size(size):
                 continue
-            if not self.filter_latency(rq.duration):
+            duration = store.duration[row]
+            if not self.filter_latency(duration):
                 continue
-            if rq.operation == sv.IORequest.OP_READ:
-                s.read_count += 1
-                s.read_total += rq.duration
-                s.read_rq.append(rq.duration)
-                s.all_read.append(rq)
-                s.read_min, s.read_max = self.iostats_minmax(
-                    rq.duration, s.read_min, s.read_max)
-            elif rq.operation == sv.IORequest.OP_WRITE:
-                s.write_count += 1
-                s.write_total += rq.duration
-                s.write_rq.append(rq.duration)
-                s.all_write.append(rq)
-                s.write_min, s.write_max = self.iostats_minmax(
-                    rq.duration, s.write_min, s.write_max)
-            elif rq.operation == sv.IORequest.OP_SYNC:
-                s.sync_count += 1
-                s.sync_total += rq.duration
-                s.sync_rq.append(rq.duration)
-                s.all_sync.append(rq)
-                s.sync_min, s.sync_max = self.iostats_minmax(
-                    rq.duration, s.sync_min, s.sync_max)
-            elif rq.operation == sv.IORequest.OP_OPEN:
-                s.open_count += 1
-                s.open_total += rq.duration
-                s.open_rq.append(rq.duration)
-                s.all_open.append(rq)
-                s.open_min, s.open_max = self.iostats_minmax(
-                    rq.duration, s.open_min, s.open_max)
+            operation = store.operation[row]
+            if operation == sv.IORequest.OP_READ:
+                s.read.add(duration)
+                if keep_rows:
+                    s.all_read.append(row)
+            elif operation == sv.IORequest.OP_WRITE:
+                s.write.add(duration)
+                if keep_rows:
+                    s.all_write.append(row)
+            elif operation == sv.IORequest.OP_SYNC:
+                s.sync.add(duration)
+                if keep_rows:
+                    s.all_sync.append(row)
+            elif operation == sv.IORequest.OP_OPEN:
+                s.open.add(duration)
+                if keep_rows:
+                    s.all_open.append(row)
 
     def compute_syscalls_latency_stats(self, end_ns):
-        s = sv.Syscalls_stats()
+        # the rows are only listed by the top and log outputs
+        s = sv.Syscalls_stats(keep_rows=self._arg_stats or self._arg_log)
         for tid in self.state.tids.values():
             if not self.filter_process(tid):
                 continue
@@ -563,38 +514,29 @@ class IoAnalysis(Command):
     def iostats_output_syscalls(self):
         s = self.syscalls_stats
         print("\nSyscalls latency statistics (usec):")
-        fmt = "{:<14} {:>14} {:>14} {:>14} {:>14} {:>14}"
+        fmt = self._STATS_FMT
         print(fmt.format("Type", "Count", "Min", "Average",
-                         "Max", "Stdev"))
-        print("-" * 89)
-        self.iostats_syscalls_line(fmt, "Open", s.open_count, s.open_min,
-                                   s.open_max, s.open_total, s.open_rq)
-        self.iostats_syscalls_line(fmt, "Read", s.read_count, s.read_min,
-                                   s.read_max, s.read_total, s.read_rq)
-        self.iostats_syscalls_line(fmt, "Write", s.write_count, s.write_min,
-                                   s.write_max, s.write_total, s.write_rq)
-        self.iostats_syscalls_line(fmt, "Sync", s.sync_count, s.sync_min,
-                                   s.sync_max, s.sync_total, s.sync_rq)
+                         "Max", "Stdev", "P50", "P99", "P99.9"))
+        print("-" * 125)
+        self.iostats_syscalls_line(fmt, "Open", s.open)
+        self.iostats_syscalls_line(fmt, "Read", s.read)
+        self.iostats_syscalls_line(fmt, "Write", s.write)
+        self.iostats_syscalls_line(fmt, "Sync", s.sync)
 
     def iolatency_syscalls_output(self):
         s = self.syscalls_stats
         print("")
-        if s.open_count > 0:
-            self.iolatency_freq_histogram(s.open_min/1000, s.open_max/1000,
-                                          self._arg_freq_resolution, s.open_rq,
+        if s.open.count > 0:
+            self.iolatency_freq_histogram(self._arg_freq_resolution, s.open,
                                           "Open latency distribution (usec)")
-        if s.read_count > 0:
-            self.iolatency_freq_histogram(s.read_min/1000, s.read_max/1000,
-                                          self._arg_freq_resolution, s.read_rq,
+        if s.read.count > 0:
+            self.iolatency_freq_histogram(self._arg_freq_resolution, s.read,
                                           "Read latency distribution (usec)")
-        if s.write_count > 0:
-            self.iolatency_freq_histogram(s.write_min/1000, s.write_max/1000,
-                                          self._arg_freq_resolution,
-                                          s.write_rq,
+        if s.write.count > 0:
+            self.iolatency_freq_histogram(self._arg_freq_resolution, s.write,
                                           "Write latency distribution (usec)")
-        if s.sync_count > 0:
-            self.iolatency_freq_histogram(s.sync_min/1000, s.sync_max/1000,
-                                          self._arg_freq_resolution, s.sync_rq,
+        if s.sync.count > 0:
+            self.iolatency_freq_histogram(self._arg_freq_resolution, s.sync,
                                           "Sync latency distribution (usec)")
 
     def iolatency_syscalls_list_output(self, title, rq_list,
@@ -618,49 +560,53 @@ class IoAnalysis(Command):
             extra_fmt + "{:<14}"
         print(title_fmt.format("Begin", "End", "Name", "Duration (usec)",
                                "Size", "Proc", "PID", extra_title, "Filename"))
-        for rq in sorted(rq_list,
-                         key=operator.attrgetter(sortkey), reverse=reverse):
-            # only limit the output if in the "top" view
-            if reverse and count > limit:
-                break
-            if rq.size is None:
-                size = "N/A"
-            else:
-                size = common.convert_size(rq.size)
-            if self._arg_extra:
-                extra = "{:<8} {:<8} {:<8} {:<8} {:<8} {:<8} ".format(
-                    rq.dirty, rq.page_alloc, rq.page_free, rq.page_written,
-                    rq.woke_kswapd, rq.page_cleared)
-            else:
-                extra = ""
-            name = rq.name.replace("syscall_entry_", "").replace("sys_", "")
-            if rq.fd is None:
-                filename = "None"
-                fd = "None"
-            else:
-                filename = rq.fd.filename
-                fd = rq.fd.fd
-            end = common.ns_to_hour_nsec(rq.end, self._arg_multi_day,
-                                         self._arg_gmt)
-
-            outrange = " "
-            duration = rq.duration
-            if self._arg_begin and rq.begin < self._arg_begin:
-                outrange = "*"
-                outrange_legend = True
-            if self._arg_end and rq.end > self._arg_end:
-                outrange = "*"
-                outrange_legend = True
-
-            print(fmt.format("[" + common.ns_to_hour_nsec(
-                rq.begin, self._arg_multi_day, self._arg_gmt) + "," +
-                end + "]" + outrange,
-                name,
-                "%0.03f" % (duration/1000) + outrange,
-                size, rq.proc.comm,
-                rq.proc.pid, extra,
-                "%s (fd=%s)" % (filename, fd)))
-            count += 1
+        store = self.state.iorequests
+        fmt_ts = common.hour_nsec_formatter(self._arg_multi_day,
+                                            self._arg_gmt)
+        with common.LineWriter() as out:
+            for row in sorted(rq_list, key=getattr(store, sortkey).__getitem__,
+                              reverse=reverse):
+                # only limit the output if in the "top" view
+                if reverse and count > limit:
+                    break
+                rq = store.get(row)
+                if rq.size is None:
+                    size = "N/A"
+                else:
+                    size = common.convert_size(rq.size)
+                if self._arg_extra:
+                    extra = "{:<8} {:<8} {:<8} {:<8} {:<8} {:<8} ".format(
+                        rq.dirty, rq.page_alloc, rq.page_free, rq.page_written,
+                        rq.woke_kswapd, rq.page_cleared)
+                else:
+                    extra = ""
+                name = rq.name.replace("syscall_entry_", "")
+                name = name.replace("sys_", "")
+                if rq.fd is None:
+                    filename = "None"
+                    fd = "None"
+                else:
+                    filename = rq.fd.filename
+                    fd = rq.fd.fd
+
+                outrange = " "
+                duration = rq.duration
+                if self._arg_begin and rq.begin < self._arg_begin:
+                    outrange = "*"
+                    outrange_legend = True
+                if self._arg_end and rq.end > self._arg_end:
+                    outrange = "*"
+                    outrange_legend = True
+
+                out.write_line(fmt.format(
+                    "[" + fmt_ts(rq.begin) + "," + fmt_ts(rq.end) + "]" +
+                    outrange,
+                    name,
+                    "%0.03f" % (duration/1000) + outrange,
+                    size, rq.proc.comm,
+                    rq.proc.pid, extra,
+                    "%s (fd=%s)" % (filename, fd)))
+                count += 1
         if outrange_legend:
             print("*: Syscalls started and/or completed outside of the "
                   "range specified")
@@ -693,18 +639,15 @@ class IoAnalysis(Command):
         if len(self.state.disks.keys()) == 0:
             return
         print("\nDisk latency statistics (usec):")
-        fmt = "{:<14} {:>14} {:>14} {:>14} {:>14} {:>14}"
-        print(fmt.format("Name", "Count", "Min", "Average", "Max", "Stdev"))
-        print("-" * 89)
+        fmt = self._STATS_FMT
+        print(fmt.format("Name", "Count", "Min", "Average", "Max", "Stdev",
+                         "P50", "P99", "P99.9"))
+        print("-" * 125)
 
         for dev in self.state.disks.keys():
             d = self.state.disks[dev]
-            if d.max is None:
-                d = self.state.disks[dev]
-            self.compute_disk_stats(d)
-            if d.count is not None:
-                self.iostats_syscalls_line(fmt, d.prettyname, d.count, d.min,
-                                           d.max, d.total, d.rq_values)
+            if d.latency.count > 0:
+                self.iostats_syscalls_line(fmt, d.prettyname, d.latency)
 
     def iostats_output(self):
         self.iostats_output_syscalls()
@@ -728,7 +671,9 @@ class IoAnalysis(Command):
         if self._arg_log:
             self.iolatency_syscalls_log_output()
 
-    def _reset_total(self, start_ts):
+    def _reset_counts(self):
+        # every reference to the stored requests is reset below
+        self.state.iorequests.clear()
         for dev in self.state.disks.keys():
             self.state.disks[dev].init_counts()
 
@@ -752,6 +697,8 @@ class IoAnalysis(Command):
         ap.add_argument('--freq-resolution', type=int, default=20,
                         help='Frequency distribution resolution '
                              '(default 20)')
+        ap.add_argument('--freq-log', action="store_true",
+                        help='Log-scale frequency distribution buckets')
         ap.add_argument('--extra', type=str, default=0,
                         help='Show extra information in stats (beta)')
         # specific argument
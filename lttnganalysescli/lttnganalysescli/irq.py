@@ -26,26 +26,24 @@ from .command import Command
 import lttnganalyses.irq
 from linuxautomaton import common, sv
 from ascii_graph import Pyasciigraph
-import statistics
 
 
 class IrqAnalysis(Command):
     _VERSION = '0.1.0'
     _DESC = """The irq command."""
+    # IRQ tracking is per-CPU and starts over at each handler entry
+    _NEEDS_HISTORY = False
+    _PROVIDERS = ['irq']
 
     def __init__(self):
         super().__init__(self._add_arguments,
                          enable_max_min_args=True,
                          enable_freq_arg=True,
                          enable_log_arg=True,
-                         enable_stats_arg=True)
+                         enable_stats_arg=True,
+                         enable_jobs_arg=True)
 
     def _validate_transform_args(self):
-        # We need the min/max in the automaton to filter
-        # at the source.
-        self._automaton.state.max = self._arg_max
-        self._automaton.state.min = self._arg_min
-
         self._arg_irq_filter_list = None
         self._arg_softirq_filter_list = None
         if self._args.irq:
@@ -97,47 +95,35 @@ class IrqAnalysis(Command):
     def _create_analysis(self):
         self._analysis = lttnganalyses.irq.IrqAnalysis(self._automaton.state)
         self.state = self._automaton.state
+        # We need the min/max in the automaton to filter at the source,
+        # set on the state the trace is read into (it can come from a
+        # snapshot)
+        self.state.max = self._arg_max
+        self.state.min = self._arg_min
+        self.state.keep_irq_list = self._arg_log
 
     def compute_stdev(self, irq):
-        values = []
-        raise_delays = []
         stdev = {}
-        for j in irq["list"]:
-            delay = j.stop_ts - j.start_ts
-            values.append(delay)
-            if j.raise_ts == -1:
-                continue
-            # Raise latency (only for some softirqs)
-            r_d = j.start_ts - j.raise_ts
-            raise_delays.append(r_d)
         if irq["count"] < 2:
             stdev["duration"] = "?"
         else:
-            stdev["duration"] = "%0.03f" % (statistics.stdev(values) / 1000)
+            stdev["duration"] = "%0.03f" % (irq["duration"].stdev() / 1000)
         # format string for the raise if present
         if irq["raise_count"] >= 2:
-            stdev["raise"] = "%0.03f" % (statistics.stdev(raise_delays)/1000)
+            stdev["raise"] = "%0.03f" % (irq["raise"].stdev() / 1000)
         return stdev
 
-    def irq_list_to_freq(self, irq, _min, _max, res, name, nr):
-        step = (_max - _min) / res
-        if step == 0:
+    def compute_quantiles(self, irq):
+        return ["%0.03f" % (irq["duration"].quantile(q) / 1000)
+                for q in (0.5, 0.99, 0.999)]
+
+    def irq_list_to_freq(self, irq, res, name, nr):
+        buckets = irq["duration"].histogram(res, scale=1000,
+                                            log=self._arg_freq_log)
+        if buckets is None:
             return
-        buckets = []
-        values = []
         graph = Pyasciigraph()
-        for i in range(res):
-            buckets.append(i * step)
-            values.append(0)
-        for i in irq["list"]:
-            v = (i.stop_ts - i.start_ts) / 1000
-            b = min(int((v-_min)/step), res - 1)
-            values[b] += 1
-        g = []
-        i = 0
-        for v in values:
-            g.append(("%0.03f" % (i * step + _min), v))
-            i += 1
+        g = [("%0.03f" % low, n) for low, n in buckets]
         for line in graph.graph('Frequency distribution %s (%s)' % (name, nr),
                                 g, info_before=True):
             print(line)
@@ -172,30 +158,27 @@ class IrqAnalysis(Command):
         title_fmt = "{:<20} {:<19} {:>15} {:>4}  {:<9} {:>4}  {:<22}"
         print(title_fmt.format("Begin", "End", "Duration (us)", "CPU",
                                "Type", "#", "Name"))
-        for i in self.state.interrupts["irq-list"]:
-            if not self.filter_irq(i):
-                continue
-            if i.irqclass == sv.IRQ.HARD_IRQ:
-                name = self.state.interrupts["names"][i.nr]
-                irqtype = "IRQ"
-            else:
-                name = sv.IRQ.soft_names[i.nr]
-                irqtype = "SoftIRQ"
-            if i.raise_ts != -1:
-                raise_ts = " (raised at %s)" % \
-                           (common.ns_to_hour_nsec(i.raise_ts,
-                                                   self._arg_multi_day,
-                                                   self._arg_gmt))
-            else:
-                raise_ts = ""
-            print(fmt.format(common.ns_to_hour_nsec(i.start_ts,
-                                                    self._arg_multi_day,
-                                                    self._arg_gmt),
-                             common.ns_to_hour_nsec(i.stop_ts,
-                                                    self._arg_multi_day,
-                                                    self._arg_gmt),
-                             "%0.03f" % ((i.stop_ts - i.start_ts) / 1000),
-                             "%d" % i.cpu_id, irqtype, i.nr, name + raise_ts))
+        fmt_ts = common.hour_nsec_formatter(self._arg_multi_day,
+                                            self._arg_gmt)
+        names = self.state.interrupts["names"]
+        with common.LineWriter() as out:
+            for i in self.state.interrupts["irq-list"]:
+                if not self.filter_irq(i):
+                    continue
+                if i.irqclass == sv.IRQ.HARD_IRQ:
+                    name = names[i.nr]
+                    irqtype = "IRQ"
+                else:
+                    name = sv.IRQ.soft_names[i.nr]
+                    irqtype = "SoftIRQ"
+                if i.raise_ts != -1:
+                    raise_ts = " (raised at %s)" % fmt_ts(i.raise_ts)
+                else:
+                    raise_ts = ""
+                out.write_line(fmt.format(
+                    fmt_ts(i.start_ts), fmt_ts(i.stop_ts),
+                    "%0.03f" % ((i.stop_ts - i.start_ts) / 1000),
+                    "%d" % i.cpu_id, irqtype, i.nr, name + raise_ts))
 
     def print_irq_stats(self, dic, name_table, filter_list, header):
         header_output = 0
@@ -222,12 +205,13 @@ class IrqAnalysis(Command):
                 continue
             avg = "%0.03f" % (dic[i]["total"] / (dic[i]["count"] * 1000))
             format_str = '{:<3} {:<18} {:>5} {:>12} {:>12} {:>12} ' \
-                         '{:>12} {:<60}'
+                         '{:>12} {:>12} {:>12} {:>12} {:<60}'
             s = format_str.format("%d:" % i, "<%s>" % name, dic[i]["count"],
                                   "%0.03f" % (dic[i]["min"] / 1000),
                                   "%s" % (avg),
                                   "%0.03f" % (dic[i]["max"] / 1000),
                                   "%s" % (stdev["duration"]),
+                                  *self.compute_quantiles(dic[i]),
                                   raise_stats)
             if self._arg_stats and (self._arg_freq or header_output == 0):
                 print(header)
@@ -235,9 +219,8 @@ class IrqAnalysis(Command):
             if self._arg_stats:
                 print(s)
             if self._arg_freq:
-                self.irq_list_to_freq(dic[i], dic[i]["min"] / 1000,
-                                      dic[i]["max"] / 1000,
-                                      self._arg_freq_resolution, name, str(i))
+                self.irq_list_to_freq(dic[i], self._arg_freq_resolution,
+                                      name, str(i))
 
     def _print_results(self, begin_ns, end_ns, final=0):
         if self._arg_stats or self._arg_freq:
@@ -259,10 +242,11 @@ class IrqAnalysis(Command):
         if self._arg_irq_filter_list is not None:
             header = ""
             header += '{:<52} {:<12}\n'.format("Hard IRQ", "Duration (us)")
-            header += '{:<22} {:<14} {:<12} {:<12} {:<10} ' \
-                      '{:<12}\n'.format("", "count", "min", "avg", "max",
-                                        "stdev")
-            header += ('-'*82 + "|")
+            header += '{:<22} {:<14} {:<12} {:<12} {:<10} {:<14} {:<12} ' \
+                      '{:<10} {:<12}\n'.format("", "count", "min", "avg",
+                                               "max", "stdev", "p50", "p99",
+                                               "p99.9")
+            header += ('-'*121 + "|")
             self.print_irq_stats(self.state.interrupts["hard-irqs"],
                                  self.state.interrupts["names"],
                                  self._arg_irq_filter_list, header)
@@ -270,15 +254,16 @@ class IrqAnalysis(Command):
 
         if self._arg_softirq_filter_list is not None:
             header = ""
-            header += '{:<52} {:<52} {:<12}\n'.format("Soft IRQ",
+            header += '{:<52} {:<91} {:<12}\n'.format("Soft IRQ",
                                                       "Duration (us)",
                                                       "Raise latency (us)")
-            header += '{:<22} {:<14} {:<12} {:<12} {:<10} {:<4} {:<3} {:<14} '\
-                      '{:<12} {:<12} {:<10} ' \
+            header += '{:<22} {:<14} {:<12} {:<12} {:<10} {:<14} {:<12} ' \
+                      '{:<10} {:<4} {:<3} {:<14} {:<12} {:<12} {:<10} ' \
                       '{:<12}\n'.format("", "count", "min", "avg", "max",
-                                        "stdev", " |", "count", "min",
-                                        "avg", "max", "stdev")
-            header += '-' * 82 + "|" + '-' * 60
+                                        "stdev", "p50", "p99", "p99.9", " |",
+                                        "count", "min", "avg", "max",
+                                        "stdev")
+            header += '-' * 121 + "|" + '-' * 60
             self.print_irq_stats(self.state.interrupts["soft-irqs"],
                                  sv.IRQ.soft_names,
                                  self._arg_softirq_filter_list,
@@ -288,7 +273,7 @@ class IrqAnalysis(Command):
     def _compute_stats(self):
         pass
 
-    def _reset_total(self, start_ts):
+    def _reset_counts(self):
         self.state = self._automaton.state
         self.state.interrupts["hard_count"] = 0
         self.state.interrupts["soft_count"] = 0
@@ -32,6 +32,7 @@ import operator
 class Memtop(Command):
     _VERSION = '0.1.0'
     _DESC = """The memtop command."""
+    _PROVIDERS = ['mem', 'statedump']
 
     def __init__(self):
         super().__init__(self._add_arguments, enable_proc_filter_args=True)
@@ -63,7 +64,7 @@ class Memtop(Command):
     def _compute_stats(self):
         pass
 
-    def _reset_total(self, start_ts):
+    def _reset_counts(self):
         self.state = self._automaton.state
         for tid in self.state.tids.keys():
             self.state.tids[tid].allocated_pages = 0
@@ -22,8 +22,11 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+
+import bisect
 import os
 import sys
+import time
 
 try:
     from progressbar import ETA, Bar, Percentage, ProgressBar
@@ -31,8 +34,12 @@ try:
 except ImportError:
     progressbar_available = False
 
-# approximation for the progress bar
-BYTES_PER_EVENT = 30
+# events read between two looks at the clock
+CHECK_EVENTS = 1000
+# minimum time between two updates of the bar (s)
+UPDATE_INTERVAL = 0.1
+# next check when there is no bar
+NO_PROGRESS = 2 ** 64
 
 
 def getFolderSize(folder):
@@ -46,36 +53,113 @@ def getFolderSize(folder):
     return total_size
 
 
-def progressbar_setup(obj):
+class Throughput():
+    """Widget showing the events/s and MB/s read so far"""
+    def __init__(self):
+        self.start = time.monotonic()
+        self.events = 0
+        self.bytes = 0
+
+    def update(self, pbar):
+        elapsed = time.monotonic() - self.start
+        if elapsed <= 0:
+            return ''
+        return '%d ev/s, %.1f MB/s' % (self.events / elapsed,
+                                       self.bytes / elapsed / 1000000)
+
+
+class TraceBytes():
+    """Estimates how many bytes of the trace are read when the events
+    up to a timestamp are, from the packets of the trace index.
+
+    The packet timestamps are in clock cycles, they are mapped to the
+    timestamps (ns) of the trace with its first and last packets.
+    Without packets, the bytes are assumed evenly spread in time."""
+    def __init__(self, obj):
+        self.begin = obj._traces.timestamp_begin
+        self.end = obj._traces.timestamp_end
+        self.total = 0
+        # packet end (ns) in increasing order, bytes read at that time
+        self._ends = []
+        self._bytes = []
+        packets = []
+        if obj._index is not None:
+            for stream in obj._index.packets.values():
+                packets += stream
+        first = min([p[3] for p in packets], default=0)
+        last = max([p[4] for p in packets], default=0)
+        if last <= first or self.end <= self.begin:
+            self.total = getFolderSize(obj._arg_path)
+            return
+        scale = (self.end - self.begin) / (last - first)
+        for offset, size, content_size, ts_begin, ts_end in \
+                sorted(packets, key=lambda p: p[4]):
+            self.total += size
+            self._ends.append(self.begin + int((ts_end - first) * scale))
+            self._bytes.append(self.total)
+
+    def at(self, ts):
+        if not self._ends:
+            if self.end <= self.begin:
+                return 0
+            ratio = (ts - self.begin) / (self.end - self.begin)
+            return int(self.total * min(max(ratio, 0), 1))
+        i = bisect.bisect_right(self._ends, ts)
+        if i == 0:
+            return 0
+        return self._bytes[i - 1]
+
+
+def progressbar_setup(obj, first_ts=None):
+    """Returns the number of events after which progressbar_update must
+    be called"""
     if hasattr(obj, "_arg_no_progress") and obj._arg_no_progress:
         obj.pbar = None
-        return
+        return NO_PROGRESS
 
-    if progressbar_available:
-        size = getFolderSize(obj._arg_path)
-        widgets = ['Processing the trace: ', Percentage(), ' ',
-                   Bar(marker='#', left='[', right=']'),
-                   ' ', ETA(), ' ']  # see docs for other options
-        obj.pbar = ProgressBar(widgets=widgets,
-                               maxval=size/BYTES_PER_EVENT)
-        obj.pbar.start()
-    else:
+    if not progressbar_available:
         print("Warning: progressbar module not available, "
               "using --no-progress.", file=sys.stderr)
         obj._arg_no_progress = True
         obj.pbar = None
-    obj.event_count = 0
+        return NO_PROGRESS
 
+    obj._pbar_bytes = TraceBytes(obj)
+    obj._pbar_first_bytes = 0
+    if first_ts is not None:
+        obj._pbar_first_bytes = obj._pbar_bytes.at(first_ts)
+    # count the events if the trace index knows how many there are
+    obj._pbar_total_events = getattr(obj, "_event_total", None)
+    if obj._pbar_total_events:
+        total = obj._pbar_total_events
+    else:
+        total = max(obj._pbar_bytes.total - obj._pbar_first_bytes, 1)
+    obj._pbar_throughput = Throughput()
+    obj._pbar_last_update = 0
+    widgets = ['Processing the trace: ', Percentage(), ' ',
+               Bar(marker='#', left='[', right=']'),
+               ' ', ETA(), ' ', obj._pbar_throughput, ' ']
+    obj.pbar = ProgressBar(widgets=widgets, maxval=total)
+    obj.pbar.start()
+    return CHECK_EVENTS
 
-def progressbar_update(obj):
-    if hasattr(obj, "_arg_no_progress") and \
-            (obj._arg_no_progress or obj.pbar is None):
-        return
-    try:
-        obj.pbar.update(obj.event_count)
-    except ValueError:
-        pass
-    obj.event_count += 1
+
+def progressbar_update(obj, count, ts):
+    """Called with the number of events read so far and the timestamp
+    of the last one, returns the count of the next call"""
+    now = time.monotonic()
+    if now - obj._pbar_last_update >= UPDATE_INTERVAL:
+        obj._pbar_last_update = now
+        done = max(obj._pbar_bytes.at(ts) - obj._pbar_first_bytes, 0)
+        obj._pbar_throughput.events = count
+        obj._pbar_throughput.bytes = done
+        if obj._pbar_total_events:
+            done = count
+        try:
+            obj.pbar.update(min(done, obj.pbar.maxval))
+        except ValueError:
+            pass
+    return count + CHECK_EVENTS
 
 
 def progressbar_finish(obj):
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+#
+# The MIT License (MIT)
+#
+# Copyright (C) 2015 - Julien Desfossez <jdesfosez@efficios.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+from .command import Command
+from . import cputop, io, irq, memtop, schedlat, syscallstats
+from collections import OrderedDict
+
+# report name -> (command class, display switches of its launcher)
+SECTIONS = OrderedDict([
+    ('cputop', (cputop.Cputop, [])),
+    ('memtop', (memtop.Memtop, [])),
+    ('syscallstats', (syscallstats.SyscallsAnalysis, [])),
+    ('schedlat', (schedlat.SchedLatAnalysis, [])),
+    ('iousagetop', (io.IoAnalysis, ['_arg_usage'])),
+    ('iolatencystats', (io.IoAnalysis, ['_arg_stats'])),
+    ('iolatencyfreq', (io.IoAnalysis, ['_arg_freq'])),
+    ('iolog', (io.IoAnalysis, ['_arg_log'])),
+    ('irqstats', (irq.IrqAnalysis, ['_arg_stats'])),
+    ('irqfreq', (irq.IrqAnalysis, ['_arg_freq'])),
+    ('irqlog', (irq.IrqAnalysis, ['_arg_log'])),
+])
+
+DEFAULT_SECTIONS = 'cputop,iousagetop,irqstats,memtop'
+
+# attributes of the report the commands read when printing their
+# results, set by the trace reading loop
+_SHARED_ATTRS = ['_handle', '_traces', '_arg_multi_day', '_arg_begin',
+                 '_arg_end', '_arg_no_progress', 'pbar', 'start_ns',
+                 'end_ns', 'trace_start_ts', 'trace_end_ts']
+
+
+class Report(Command):
+    _VERSION = '0.1.0'
+    _DESC = """Run several analyses in a single pass over the trace."""
+
+    def __init__(self):
+        # the selected commands, in the order of their first section,
+        # before Command creates the automaton they share
+        self._commands = OrderedDict()
+        super().__init__(self._add_arguments,
+                         enable_proc_filter_args=True,
+                         enable_max_min_args=True,
+                         enable_max_min_size_arg=True,
+                         enable_log_arg=True,
+                         enable_stats_arg=True)
+        # one command per class, they declare their own arguments
+        self._all_commands = OrderedDict()
+        for cls, attrs in SECTIONS.values():
+            if cls not in self._all_commands:
+                cmd = cls()
+                # the report reads the trace in a single process
+                cmd._enable_jobs_arg = False
+                self._all_commands[cls] = cmd
+        self._titles = {}
+
+    def _validate_transform_args(self):
+        names = self._args.analyses.split(',')
+        for name in names:
+            if name not in SECTIONS:
+                self._cmdline_error('unknown analysis: %s (choose from %s)'
+                                    % (name, ', '.join(SECTIONS)))
+        switches = {}
+        for name in names:
+            cls, attrs = SECTIONS[name]
+            if cls not in self._commands:
+                cmd = self._all_commands[cls]
+                self._commands[cls] = cmd
+                self._titles[cls] = []
+                switches[cls] = []
+            if name not in self._titles[cls]:
+                self._titles[cls].append(name)
+            switches[cls] += attrs
+        # the commands share the automaton of the report, with the
+        # providers of all of them, create it before any of them
+        # touches its state
+        providers = [cmd._PROVIDERS for cmd in self._commands.values()]
+        if None not in providers:
+            self._PROVIDERS = sorted(set().union(*providers))
+        self._create_automaton()
+        for cls, cmd in self._commands.items():
+            cmd._args = self._args
+            cmd._validate_transform_common_args(self._args)
+            cmd._validate_transform_args()
+            for attr in switches[cls]:
+                setattr(cmd, attr, True)
+        self._NEEDS_HISTORY = any(cmd._NEEDS_HISTORY
+                                  for cmd in self._commands.values())
+
+    def run(self):
+        # parse arguments first
+        self._parse_args()
+        # validate, transform and save specific arguments
+        self._validate_transform_args()
+        # open the trace
+        self._open_trace()
+        # create the appropriate analysis/analyses
+        self._create_analysis()
+        # run the analysis
+        break_cb = None
+        if any(hasattr(cmd, '_breakcb') for cmd in self._commands.values()):
+            break_cb = self._breakcb
+        self._run_analysis(self._reset_total, self._refresh,
+                           break_cb=break_cb)
+        # process the results
+        self._compute_stats()
+        # print results
+        self._print_results(self.start_ns, self.trace_end_ts, final=1)
+        # close the trace
+        self._close_trace()
+
+    def _create_automaton(self, state=None):
+        # also called when a snapshot is restored, the commands must
+        # build their analyses on the new automaton
+        super()._create_automaton(state)
+        for cmd in self._commands.values():
+            cmd._automaton = self._automaton
+
+    def _create_analysis(self):
+        for cmd in self._commands.values():
+            cmd._create_analysis()
+
+    def _register_analyses(self):
+        for cmd in self._commands.values():
+            self._automaton.add_analysis(cmd._analysis)
+
+    def _sync_command(self, cmd):
+        for attr in _SHARED_ATTRS:
+            if hasattr(self, attr):
+                setattr(cmd, attr, getattr(self, attr))
+
+    def _breakcb(self):
+        for cmd in self._commands.values():
+            if hasattr(cmd, '_breakcb') and not cmd._breakcb():
+                return False
+        return True
+
+    def _compute_stats(self):
+        for cmd in self._commands.values():
+            self._sync_command(cmd)
+            cmd._compute_stats()
+
+    def _print_results(self, begin_ns, end_ns, final=0):
+        for cls, cmd in self._commands.items():
+            self._sync_command(cmd)
+            print('=' * 80)
+            print(', '.join(self._titles[cls]))
+            print('=' * 80)
+            cmd._print_results(begin_ns, end_ns, final)
+            print('')
+
+    def _reset_counts(self):
+        for cmd in self._commands.values():
+            self._sync_command(cmd)
+            cmd._reset_counts()
+
+    def _start_window(self, start_ts):
+        # the commands share the state, none of them seeds the new
+        # window before all the counters are cleared
+        for cmd in self._commands.values():
+            cmd._start_window(start_ts)
+
+    def _refresh(self, begin, end):
+        # every section is printed before any of them resets the state
+        # they share
+        self._compute_stats()
+        self._print_results(begin, end, final=0)
+        self._reset_total(end)
+
+    def _add_arguments(self, ap):
+        ap.add_argument('--analyses', type=str, default=DEFAULT_SECTIONS,
+                        help='Comma-separated list of analyses to run, '
+                             'among: %s (default %s)' %
+                             (', '.join(SECTIONS), DEFAULT_SECTIONS))
+        # the I/O command declares --freq-resolution itself
+        ap.add_argument('--freq', action="store_true",
+                        help='Show the frequency distributions')
+        for cmd in self._all_commands.values():
+            cmd._add_arguments(ap)
+
+
+# entry point
+def run():
+    # create command
+    reportcmd = Report()
+
+    # execute command
+    reportcmd.run()
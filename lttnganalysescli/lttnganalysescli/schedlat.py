@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+#
+# The MIT License (MIT)
+#
+# Copyright (C) 2015 - Julien Desfossez <jdesfosez@efficios.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+from .command import Command
+import lttnganalyses.sched
+from linuxautomaton import common
+from linuxautomaton.stats import LatencyStats
+from ascii_graph import Pyasciigraph
+
+
+class SchedLatAnalysis(Command):
+    _VERSION = '0.1.0'
+    _DESC = """The scheduling latency command."""
+    _PROVIDERS = ['sched', 'statedump']
+    _STATS_FMT = "{:<28} {:>8} {:>12} {:>12} {:>12} {:>12} {:>12} {:>12} " \
+        "{:>12}"
+
+    def __init__(self):
+        super().__init__(self._add_arguments,
+                         enable_proc_filter_args=True,
+                         enable_freq_arg=True)
+
+    def _validate_transform_args(self):
+        pass
+
+    def run(self):
+        # parse arguments first
+        self._parse_args()
+        # validate, transform and save specific arguments
+        self._validate_transform_args()
+        # open the trace
+        self._open_trace()
+        # create the appropriate analysis/analyses
+        self._create_analysis()
+        # run the analysis
+        self._run_analysis(self._reset_total, self._refresh)
+        # process the results
+        self._compute_stats()
+        # print results
+        self._print_results(self.start_ns, self.trace_end_ts, final=1)
+        # close the trace
+        self._close_trace()
+
+    def _create_analysis(self):
+        self._analysis = lttnganalyses.sched.SchedAnalysis(
+            self._automaton.state)
+        self.state = self._automaton.state
+
+    def _compute_stats(self):
+        pass
+
+    def _refresh(self, begin, end):
+        self._compute_stats()
+        self._print_results(begin, end, final=0)
+        self._reset_total(end)
+
+    def filter_process(self, proc):
+        if self._arg_proc_list and proc.comm not in self._arg_proc_list:
+            return False
+        if self._arg_pid_list and str(proc.pid) not in self._arg_pid_list:
+            return False
+        return True
+
+    def stats_line(self, name, stats):
+        if stats.count < 2:
+            stdev = "?"
+        else:
+            stdev = "%0.03f" % (stats.stdev() / 1000)
+        quantiles = ["%0.03f" % (stats.quantile(q) / 1000)
+                     for q in (0.5, 0.99, 0.999)]
+        print(self._STATS_FMT.format(
+            name, stats.count, "%0.03f" % (stats.min / 1000),
+            "%0.03f" % (stats.total / (stats.count * 1000)),
+            "%0.03f" % (stats.max / 1000), stdev, *quantiles))
+
+    def freq_histogram(self, stats, res):
+        buckets = stats.histogram(res, scale=1000, log=self._arg_freq_log)
+        if buckets is None:
+            return
+        graph = Pyasciigraph()
+        g = [("%0.03f" % low, n) for low, n in buckets]
+        for line in graph.graph('Scheduling latency distribution (usec)',
+                                g, info_before=True):
+            print(line)
+        print("")
+
+    def _print_results(self, begin_ns, end_ns, final=0):
+        count = 0
+        limit = self._arg_limit
+        print('Timerange: [%s, %s]' % (
+            common.ns_to_hour_nsec(begin_ns, gmt=self._arg_gmt,
+                                   multi_day=True),
+            common.ns_to_hour_nsec(end_ns, gmt=self._arg_gmt,
+                                   multi_day=True)))
+        print("\nScheduling latency statistics (usec):")
+        print(self._STATS_FMT.format("Process", "Count", "Min", "Average",
+                                     "Max", "Stdev", "P50", "P99", "P99.9"))
+        print("-" * 128)
+        total = LatencyStats()
+        for tid in sorted(self.state.tids.values(),
+                          key=lambda t: t.sched_latency.max or 0,
+                          reverse=True):
+            if tid.sched_latency.count == 0 or not self.filter_process(tid):
+                continue
+            total.merge(tid.sched_latency)
+            if limit > 0 and count >= limit:
+                continue
+            self.stats_line("%s (%d)" % (tid.comm, tid.tid),
+                            tid.sched_latency)
+            count += 1
+        if total.count == 0:
+            return
+        print("-" * 128)
+        self.stats_line("All", total)
+        print("")
+        if self._arg_freq:
+            self.freq_histogram(total, self._arg_freq_resolution)
+
+    def _reset_counts(self):
+        for tid in self.state.tids.values():
+            tid.sched_latency = LatencyStats()
+
+    def _add_arguments(self, ap):
+        # specific argument
+        pass
+
+
+# entry point
+def run():
+    # create command
+    schedlatcmd = SchedLatAnalysis()
+
+    # execute command
+    schedlatcmd.run()
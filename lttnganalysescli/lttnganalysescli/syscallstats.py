@@ -31,10 +31,12 @@ import operator
 class SyscallsAnalysis(Command):
     _VERSION = '0.1.0'
     _DESC = """The I/O command."""
+    _PROVIDERS = ['syscalls', 'statedump']
 
     def __init__(self):
         super().__init__(self._add_arguments,
-                         enable_proc_filter_args=True)
+                         enable_proc_filter_args=True,
+                         enable_jobs_arg=True)
 #                         enable_max_min_args=True,
 #                         enable_max_min_size_arg=True,
 #                         enable_freq_arg=True,
@@ -109,9 +111,6 @@ class SyscallsAnalysis(Command):
 
         print("\nTotal syscalls: %d" % (self.state.syscalls["total"]))
 
-    def _reset_total(self, start_ts):
-        pass
-
     def _add_arguments(self, ap):
         # specific argument
         pass
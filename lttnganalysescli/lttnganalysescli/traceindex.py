@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+#
+# The MIT License (MIT)
+#
+# Copyright (C) 2015 - Julien Desfossez <jdesfosez@efficios.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import struct
+import zlib
+from linuxautomaton import common, snapshot
+
+INDEX_VERSION = 1
+
+# LTTng packet index files (<trace>/index/<stream>.idx)
+CTF_INDEX_MAGIC = 0xC1F1DCC1
+CTF_INDEX_HDR = struct.Struct('>IIII')
+# offset, packet_size, content_size, timestamp_begin, timestamp_end
+CTF_INDEX_ENTRY = struct.Struct('>QQQQQ')
+
+
+def _cache_dir():
+    base = os.environ.get('XDG_CACHE_HOME',
+                          os.path.join(os.path.expanduser('~'), '.cache'))
+    return os.path.join(base, 'lttng-analyses')
+
+
+def _trace_signature(path):
+    """List of (file, size, mtime) of everything under the trace path,
+    any change in the trace invalidates the index"""
+    sig = []
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for f in sorted(files):
+            fullpath = os.path.join(root, f)
+            st = os.stat(fullpath)
+            sig.append([os.path.relpath(fullpath, path), st.st_size,
+                        st.st_mtime_ns])
+    return sig
+
+
+def _read_packet_index(path):
+    packets = []
+    with open(path, 'rb') as f:
+        hdr = f.read(CTF_INDEX_HDR.size)
+        if len(hdr) < CTF_INDEX_HDR.size:
+            return packets
+        magic, major, minor, entry_len = CTF_INDEX_HDR.unpack(hdr)
+        if magic != CTF_INDEX_MAGIC or entry_len < CTF_INDEX_ENTRY.size:
+            return packets
+        while True:
+            entry = f.read(entry_len)
+            if len(entry) < entry_len:
+                break
+            offset, packet_size, content_size, ts_begin, ts_end = \
+                CTF_INDEX_ENTRY.unpack_from(entry)
+            # sizes are in bits, timestamps in clock cycles
+            packets.append([offset, packet_size // 8, content_size // 8,
+                            ts_begin, ts_end])
+    return packets
+
+
+class TraceIndex():
+    """Sidecar index of a trace, kept in the user cache directory.
+
+    It holds the packets of every stream (from the LTTng index files)
+    and, once a run went through the whole trace, the number of events
+    per second and per event name. The automaton state snapshots and
+    the event cache of the trace live next to it and are dropped with
+    it.
+
+    The packets are only used to estimate the progress: the babeltrace
+    bindings can't start an iterator at a file offset, seeking to
+    --begin is left to events_timestamps(), which seeks with the packet
+    index of the streams it loaded."""
+    def __init__(self, path):
+        self._path = os.path.abspath(path)
+        key = hashlib.sha1(self._path.encode()).hexdigest()
+        self._file = os.path.join(_cache_dir(), key + '.json')
+        self.snapshot_dir = os.path.join(_cache_dir(), key + '.snapshots')
+        self.events_dir = os.path.join(_cache_dir(), key + '.events')
+        self.signature = None
+        # stream file -> list of [offset, size, content size,
+        #                         begin cycles, end cycles]
+        self.packets = {}
+        # second of trace time -> number of events
+        self.seconds = {}
+        # event name -> number of events
+        self.names = {}
+        # the counts cover the whole trace
+        self.complete = False
+
+    def open(self):
+        """Load the index if it is still valid for the trace, rebuild its
+        packet part otherwise"""
+        self.signature = _trace_signature(self._path)
+        if self._load():
+            return
+        self.packets = {}
+        self.seconds = {}
+        self.names = {}
+        self.complete = False
+        shutil.rmtree(self.snapshot_dir, ignore_errors=True)
+        shutil.rmtree(self.events_dir, ignore_errors=True)
+        for root, dirs, files in os.walk(self._path):
+            if os.path.basename(root) != 'index':
+                continue
+            for f in files:
+                if not f.endswith('.idx'):
+                    continue
+                stream = os.path.relpath(os.path.join(root, '..', f[:-4]),
+                                         self._path)
+                self.packets[stream] = _read_packet_index(
+                    os.path.join(root, f))
+        self.save()
+
+    def _load(self):
+        try:
+            with open(self._file) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if data.get('version') != INDEX_VERSION or \
+                data.get('signature') != self.signature:
+            return False
+        self.packets = data['packets']
+        self.seconds = {int(sec): count
+                        for sec, count in data['seconds'].items()}
+        self.names = data['names']
+        self.complete = data['complete']
+        return True
+
+    def save(self):
+        data = {
+            'version': INDEX_VERSION,
+            'path': self._path,
+            'signature': self.signature,
+            'packets': self.packets,
+            'seconds': self.seconds,
+            'names': self.names,
+            'complete': self.complete,
+        }
+        # the index is only an optimization, never fail because of it
+        try:
+            os.makedirs(os.path.dirname(self._file), exist_ok=True)
+            tmp = self._file + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp, self._file)
+        except OSError:
+            pass
+
+    def add_event(self, name, ts):
+        sec = ts // common.NSEC_PER_SEC
+        self.seconds[sec] = self.seconds.get(sec, 0) + 1
+        self.names[name] = self.names.get(name, 0) + 1
+
+    def _snapshot_dir(self, providers):
+        # a state only holds what its providers built, snapshots are
+        # kept apart per set of providers
+        return os.path.join(self.snapshot_dir, '-'.join(providers))
+
+    def snapshot_path(self, ts, providers):
+        return os.path.join(self._snapshot_dir(providers), '%d.snap' % ts)
+
+    def write_snapshot(self, state, ts, providers):
+        try:
+            os.makedirs(self._snapshot_dir(providers), exist_ok=True)
+            snapshot.write(self.snapshot_path(ts, providers), state, ts)
+        except OSError:
+            pass
+
+    def load_snapshot(self, ts, providers):
+        """Latest snapshot taken at or before ts by an automaton with the
+        same providers as (timestamp, state), None if there is none"""
+        try:
+            files = os.listdir(self._snapshot_dir(providers))
+        except OSError:
+            return None
+        candidates = []
+        for f in files:
+            if not f.endswith('.snap'):
+                continue
+            try:
+                snap_ts = int(f[:-5])
+            except ValueError:
+                continue
+            if snap_ts <= ts:
+                candidates.append(snap_ts)
+        for snap_ts in sorted(candidates, reverse=True):
+            try:
+                snap = snapshot.read(self.snapshot_path(snap_ts, providers))
+            except (OSError, EOFError, ValueError, zlib.error,
+                    pickle.UnpicklingError):
+                snap = None
+            if snap is not None:
+                return snap
+        return None
+
+    def event_count(self, begin=None, end=None):
+        """Number of events in [begin, end] (ns, rounded to the second),
+        None if unknown"""
+        if not self.complete:
+            return None
+        first = None
+        last = None
+        if begin is not None:
+            first = begin // common.NSEC_PER_SEC
+        if end is not None:
+            last = end // common.NSEC_PER_SEC
+        total = 0
+        for sec, count in self.seconds.items():
+            if first is not None and sec < first:
+                continue
+            if last is not None and sec > last:
+                continue
+            total += count
+        return total
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+#
+# The MIT License (MIT)
+#
+# Copyright (C) 2015 - Julien Desfossez <jdesfosez@efficios.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+
+import contextlib
+import io
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+try:
+    import babeltrace  # noqa: F401
+except ImportError:
+    raise unittest.SkipTest('the babeltrace bindings are not installed')
+
+from eventgen import BASE_TS, EventGenerator
+from lttnganalysescli import command, irq, report, schedlat
+
+NR_CPUS = 4
+
+
+class FakeTraces():
+    """TraceCollection over the synthetic events, a trace path only
+    holds the events of the CPUs of its <channel>_<cpu> stream files"""
+    all_events = []
+
+    def add_traces_recursive(self, path, fmt):
+        cpus = set()
+        for root, dirs, files in os.walk(path):
+            for f in files:
+                m = re.match(r'^.+_(\d+)$', f)
+                if m is not None:
+                    cpus.add(int(m.group(1)))
+        self._events = [e for e in self.all_events if e['cpu_id'] in cpus]
+        self.timestamp_begin = self._events[0].timestamp
+        self.timestamp_end = self._events[-1].timestamp
+        return {0: self}
+
+    def remove_trace(self, handle):
+        pass
+
+    @property
+    def events(self):
+        return iter(self._events)
+
+    def events_timestamps(self, begin, end):
+        return (e for e in self._events if begin <= e.timestamp <= end)
+
+
+class CommandTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        gen = EventGenerator(nr_threads=40, nr_cpus=NR_CPUS, duration=10,
+                             seed=1)
+        FakeTraces.all_events = gen.events(20000)
+
+    def setUp(self):
+        self._tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self._tmp)
+        # a kernel trace with one stream file per CPU
+        self.trace = os.path.join(self._tmp, 'trace', 'kernel')
+        os.makedirs(self.trace)
+        for name in ['metadata'] + ['channel0_%d' % cpu
+                                    for cpu in range(NR_CPUS)]:
+            open(os.path.join(self.trace, name), 'w').close()
+        # the index and snapshots go to the user cache directory
+        env = mock.patch.dict(os.environ, {
+            'XDG_CACHE_HOME': os.path.join(self._tmp, 'cache')})
+        env.start()
+        self.addCleanup(env.stop)
+        traces = mock.patch.object(command, 'TraceCollection', FakeTraces)
+        traces.start()
+        self.addCleanup(traces.stop)
+
+    def _run(self, cmd, run, *args):
+        argv = ['lttng-analyses', self.trace, '--no-progress'] + list(args)
+        out = io.StringIO()
+        with mock.patch.object(sys, 'argv', argv), \
+                contextlib.redirect_stdout(out):
+            run(cmd)
+        return out.getvalue()
+
+    @staticmethod
+    def _date(sec):
+        """--begin/--end argument sec seconds into the trace"""
+        return time.strftime('%Y-%m-%d %H:%M:%S',
+                             time.localtime(BASE_TS // 10 ** 9 + sec))
+
+    def test_report_restored_snapshot(self):
+        args = ['--begin', self._date(6), '--min', '500', '--analyses',
+                'cputop,memtop,syscallstats,schedlat,iousagetop,'
+                'irqstats,irqlog']
+        replayed = self._run(report.Report(), report.Report.run, *args)
+        # the first run over the whole trace saves the snapshots
+        self._run(report.Report(), report.Report.run,
+                  '--snapshot-interval', '1')
+        rep = report.Report()
+        restored = self._run(rep, report.Report.run, *args)
+        self.assertIsNotNone(rep._resume_ts)
+        self.assertIn('proc1000', restored)
+        self.assertEqual(restored, replayed)
+
+    def test_irqlog_jobs(self):
+        run = irq.IrqAnalysis.run_log
+        serial = self._run(irq.IrqAnalysis(), run, '-j', '1')
+        parallel = self._run(irq.IrqAnalysis(), run, '-j', '2')
+        self.assertIn('Begin', serial)
+        self.assertEqual(parallel, serial)
+
+    def test_schedlat_freq_log(self):
+        run = schedlat.SchedLatAnalysis.run
+        linear = self._run(schedlat.SchedLatAnalysis(), run, '--freq')
+        log = self._run(schedlat.SchedLatAnalysis(), run, '--freq',
+                        '--freq-log')
+        self.assertIn('Scheduling latency distribution', log)
+        self.assertNotEqual(log, linear)